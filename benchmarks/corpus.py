@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  Deterministic synthetic Kotlin sources for the benchmarks
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+# Writes a tree of generated Kotlin sources, the same parameters and seed
+# always give the same tree. Run as: python benchmarks/corpus.py <path>
+
+import argparse
+import io
+import os
+import random
+
+default_params = {
+    'files': 50,
+    'classes': 10,      # top level classes per file
+    'members': 8,       # functions and properties per class
+    'nesting': 1,       # depth of nested classes
+    'enum_size': 6,     # cases per enum class
+    'ctor_params': 4,   # parameters of the data class constructors
+    'kdoc': 0.7,        # share of declarations with a documentation block
+    'seed': 1,
+}
+
+types = ['Int', 'Long', 'String', 'Boolean', 'Double', 'List<String>', 'Map<String, Int>']
+scopes = ['', '', '', 'private ', 'internal ', 'open ']
+
+
+class KotlinCorpus(object):
+    """Generator of one synthetic source tree."""
+
+    def __init__(self, **params):
+        self.params = dict(default_params)
+        self.params.update(params)
+        self.random = random.Random(self.params['seed'])
+        self.counter = 0
+
+    def name(self, prefix):
+        self.counter += 1
+        return '{}{}'.format(prefix, self.counter)
+
+    def kdoc(self, out, indent, text, params=(), properties=()):
+        if self.random.random() >= self.params['kdoc']:
+            return
+        out.append(indent + '/**\n')
+        out.append(indent + ' * {}.\n'.format(text))
+        if self.random.random() < 0.3:
+            out.append(indent + ' *\n')
+            out.append(indent + ' * ```\n')
+            out.append(indent + ' * val x = {}()\n'.format(text.split()[-1]))
+            out.append(indent + ' * ```\n')
+        for name in params:
+            out.append(indent + ' * @param {} the {} value\n'.format(name, name))
+        for name in properties:
+            out.append(indent + ' * @property {} the {} property\n'.format(name, name))
+        if params and self.random.random() < 0.5:
+            out.append(indent + ' * @return the result\n')
+        out.append(indent + ' */\n')
+
+    def function(self, out, indent):
+        name = self.name('call')
+        params = ['p{}'.format(i) for i in range(self.random.randint(0, 3))]
+        self.kdoc(out, indent, 'Function ' + name, params)
+        signature = ', '.join('{}: {}'.format(p, self.random.choice(types)) for p in params)
+        scope = self.random.choice(scopes)
+        if self.random.random() < 0.5:
+            out.append(indent + '{}fun {}({}): Int = {}\n'.format(scope, name, signature, len(params)))
+        else:
+            out.append(indent + '{}fun {}({}) {{\n'.format(scope, name, signature))
+            out.append(indent + '    val text = "brace { in a string"\n')
+            out.append(indent + '    if (text.isEmpty()) {\n')
+            out.append(indent + '        println("${text.length}")\n')
+            out.append(indent + '    }\n')
+            out.append(indent + '}\n')
+        out.append('\n')
+
+    def property(self, out, indent):
+        name = self.name('value')
+        self.kdoc(out, indent, 'Property ' + name)
+        keyword = self.random.choice(['val', 'var'])
+        out.append(indent + '{}{} {}: Int = {}\n'.format(self.random.choice(scopes), keyword, name, self.counter))
+        out.append('\n')
+
+    def enum_class(self, out, indent):
+        name = self.name('Kind')
+        self.kdoc(out, indent, 'Enum ' + name)
+        out.append(indent + 'enum class {}(val code: Int) {{\n'.format(name))
+        size = self.params['enum_size']
+        for case in range(size):
+            separator = ',' if case < size - 1 else ';'
+            out.append(indent + '    CASE_{}({}){}\n'.format(case, case, separator))
+        out.append(indent + '}\n\n')
+
+    def data_class(self, out, indent):
+        name = self.name('Record')
+        params = ['field{}'.format(i) for i in range(self.params['ctor_params'])]
+        self.kdoc(out, indent, 'Data class ' + name, properties=params)
+        out.append(indent + 'data class {}(\n'.format(name))
+        for index, param in enumerate(params):
+            separator = ',' if index < len(params) - 1 else ''
+            out.append(indent + '    val {}: {}{}\n'.format(param, self.random.choice(types), separator))
+        out.append(indent + ')\n\n')
+
+    def class_(self, out, indent, depth):
+        name = self.name('Generated')
+        self.kdoc(out, indent, 'Class ' + name, params=['id'])
+        keyword = self.random.choice(['class', 'class', 'open class', 'interface'])
+        if keyword == 'interface':
+            out.append(indent + 'interface {} {{\n'.format(name))
+        else:
+            out.append(indent + '{} {}(val id: Long) {{\n'.format(keyword, name))
+        inner = indent + '    '
+        for member in range(self.params['members']):
+            if keyword != 'interface' and self.random.random() < 0.3:
+                self.property(out, inner)
+            else:
+                self.function(out, inner)
+        if depth < self.params['nesting']:
+            self.class_(out, inner, depth + 1)
+        if keyword != 'interface' and self.random.random() < 0.2:
+            out.append(inner + 'companion object {\n')
+            self.function(out, inner + '    ')
+            out.append(inner + '}\n')
+        out.append(indent + '}\n\n')
+
+    def source(self, package):
+        out = ['package {}\n'.format(package), '\n', 'import kotlin.math.max\n', '\n']
+        for number in range(self.params['classes']):
+            choice = self.random.random()
+            if choice < 0.15:
+                self.enum_class(out, '')
+            elif choice < 0.3:
+                self.data_class(out, '')
+            elif choice < 0.4:
+                self.function(out, '')
+            else:
+                self.class_(out, '', 0)
+        return out
+
+    def write(self, path):
+        """Write the tree into path, returns the list of written files."""
+        files = []
+        for number in range(self.params['files']):
+            package = 'com.example.bench.p{}'.format(number % 10)
+            folder = os.path.join(path, *package.split('.'))
+            try:
+                os.makedirs(folder)
+            except OSError:
+                pass
+            filename = os.path.join(folder, 'Source{}.kt'.format(number))
+            with io.open(filename, mode='w', encoding='utf-8', newline='\n') as fp:
+                fp.write(''.join(self.source(package)))
+            files.append(filename)
+        return files
+
+
+def add_arguments(parser):
+    for key, value in sorted(default_params.items()):
+        parser.add_argument('--' + key.replace('_', '-'), dest=key, type=type(value),
+                            default=value, help='(default: {})'.format(value))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic Kotlin source tree.')
+    parser.add_argument('path', type=str, help='Path to write the sources to')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    params = dict((key, getattr(args, key)) for key in default_params)
+    files = KotlinCorpus(**params).write(args.path)
+    print(('Written {} files to {}'.format(len(files), args.path)))
+
+
+if __name__ == "__main__":
+    main()
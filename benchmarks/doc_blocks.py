@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  Benchmark of the documentation block lookup
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+# Compares get_doc_block lookbacks with the precomputed KotlinDocIndex on a
+# generated file, run as: python benchmarks/doc_blocks.py [lines]
+
+import sys
+import time
+
+from kotlin_domain.indexer import get_doc_block
+from kotlin_domain.lexer import KotlinDocIndex
+
+
+def make_content(lines):
+    content = ['package benchmark\n', '\n', 'class Generated {\n']
+    member = 0
+    while len(content) < lines - 1:
+        content.extend([
+            '    /**\n',
+            '     * Member number {}.\n'.format(member),
+            '     * @param value the value\n',
+            '     */\n',
+            '    fun member{}(value: Int): Int = value\n'.format(member),
+            '\n',
+        ])
+        member += 1
+    content.append('}\n')
+    return content
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    content = make_content(lines)
+    declarations = [i for i, l in enumerate(content) if 'fun member' in l]
+
+    start = time.perf_counter()
+    expected = [get_doc_block(content, i - 1) for i in declarations]
+    lookback = time.perf_counter() - start
+
+    start = time.perf_counter()
+    docs = KotlinDocIndex(content)
+    result = [docs.doc_block(i - 1) for i in declarations]
+    indexed = time.perf_counter() - start
+
+    assert result == expected
+    print('{} lines, {} declarations'.format(len(content), len(declarations)))
+    print('get_doc_block:  {:.3f} s'.format(lookback))
+    print('KotlinDocIndex: {:.3f} s'.format(indexed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  Benchmark of the indexer on one huge generated Kotlin file
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+# Writes one synthetic Kotlin file of the given size, like the sources made by
+# protobuf or SQL code generators, and indexes it read as a whole and memory
+# mapped. Every run is a separate process so the peak RSS is its own. Run as:
+#   python benchmarks/huge_file.py --size 100
+
+import argparse
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from corpus import KotlinCorpus
+
+
+def write_file(filename, size, seed):
+    corpus = KotlinCorpus(seed=seed, nesting=2, members=12)
+    written = 0
+    with io.open(filename, mode='w', encoding='utf-8', newline='\n') as fp:
+        fp.write('package com.example.generated\n\n')
+        while written < size:
+            out = []
+            for number in range(100):
+                corpus.class_(out, '', 0)
+            text = ''.join(out)
+            fp.write(text)
+            written += len(text)
+    return os.path.getsize(filename)
+
+
+def index_child(filename, mapped, lookback):
+    from kotlin_domain.indexer import KotlinFileIndex
+
+    KotlinFileIndex.verbose = False
+    KotlinFileIndex.mmap_threshold = 0 if mapped else None
+    KotlinFileIndex.doc_lookback = lookback
+    start = time.perf_counter()
+    symbols = KotlinFileIndex.index_file(filename)
+    print(('{:.3f} {}'.format(time.perf_counter() - start, len(symbols))))
+
+
+def bench_mode(filename, mapped, lookback):
+    command = [sys.executable, os.path.abspath(__file__), '--child', filename,
+               '--doc-lookback', str(lookback)]
+    if mapped:
+        command.append('--mapped')
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    output = process.stdout.read()
+    peak = None
+    if hasattr(os, 'wait4'):
+        pid, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        # kilobytes on Linux
+        peak = usage.ru_maxrss
+    else:
+        process.wait()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+    seconds, symbols = output.split()
+    return float(seconds), int(symbols), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index one huge generated Kotlin file.')
+    parser.add_argument('--size', type=float, default=100, help='Size of the file in MB (default: 100)')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the generated source (default: 1)')
+    parser.add_argument('--doc-lookback', dest='doc_lookback', type=int, default=1000,
+                        help='Lines searched upwards for documentation in mapped mode (default: 1000)')
+    parser.add_argument('--keep', type=str, default=None, help='Write the file to this path and keep it')
+    parser.add_argument('--child', type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--mapped', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        index_child(args.child, args.mapped, args.doc_lookback)
+        return
+
+    work_dir = tempfile.mkdtemp(prefix='kotlinsphinx-huge-')
+    try:
+        filename = args.keep or os.path.join(work_dir, 'Generated.kt')
+        size = write_file(filename, int(args.size * 1024 * 1024), args.seed)
+        print(('Source: {:.1f} MB'.format(size / 1024.0 / 1024.0)))
+
+        for name, mapped in (('read', False), ('mmap', True)):
+            seconds, symbols, peak = bench_mode(filename, mapped, args.doc_lookback)
+            line = '{:6} {:8.2f} s  {} symbols'.format(name, seconds, symbols)
+            if peak is not None:
+                line += '  peak RSS {:.1f} MB'.format(peak / 1024.0)
+            print(line)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
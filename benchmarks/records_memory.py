@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  Memory benchmark of the symbol records
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+# Compares the memory held by the parsed symbols as plain dicts and as
+# slotted records, run as: python benchmarks/records_memory.py [classes]
+
+import gc
+import sys
+import tracemalloc
+
+from kotlin_domain.indexer import KotlinFileIndex, KotlinObjectIndex, drop_raw
+from kotlin_domain.records import KotlinSymbol, KotlinMember
+
+
+def make_content(classes):
+    content = ['package benchmark\n', '\n']
+    for number in range(classes):
+        content.extend([
+            '/**\n',
+            ' * Class number {}.\n'.format(number),
+            ' * @property id the identifier\n',
+            ' */\n',
+            'data class Generated{}(val id: Long, private val name: String) {{\n'.format(number),
+        ])
+        for member in range(8):
+            content.extend([
+                '    /**\n',
+                '     * Member number {}.\n'.format(member),
+                '     * @param value the value\n',
+                '     */\n',
+                '    fun member{}(value: Int): Int = value\n'.format(member),
+                '\n',
+            ])
+        content.extend(['    private var counter: Int = 0\n', '}\n', '\n'])
+    return content
+
+
+def measure(content, symbol_type, member_type, keep_raw=True):
+    KotlinFileIndex.symbol_type = symbol_type
+    KotlinObjectIndex.member_type = member_type
+    gc.collect()
+    tracemalloc.start()
+    symbols = KotlinFileIndex.parse('/src/benchmark/Generated.kt', content)
+    if not keep_raw:
+        drop_raw(symbols)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    count = sum(1 + len(item['members'].index) for item in symbols)
+    return size, count
+
+
+def main():
+    classes = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    content = make_content(classes)
+
+    results = [
+        ('dicts', measure(content, dict, dict)),
+        ('records', measure(content, KotlinSymbol, KotlinMember)),
+        ('records, no raw', measure(content, KotlinSymbol, KotlinMember, False)),
+    ]
+    KotlinFileIndex.symbol_type = KotlinSymbol
+    KotlinObjectIndex.member_type = KotlinMember
+
+    print('{} lines, {} symbols'.format(len(content), results[0][1][1]))
+    for name, (size, count) in results:
+        print('{:16} {:8.1f} MB'.format(name + ':', size / 1024.0 / 1024.0))
+
+
+if __name__ == "__main__":
+    main()
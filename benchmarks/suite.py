@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  Benchmark suite of the indexer and the generator
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+# Times the indexer, the documentation rendering and whole kotlinsphinx runs
+# on a generated corpus and saves the results as JSON. Run as:
+#   python benchmarks/suite.py --output new.json --compare old.json
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from corpus import KotlinCorpus, add_arguments, default_params
+
+from kotlin_domain import __version__
+from kotlin_domain import indexer
+from kotlin_domain.indexer import KotlinFileIndex, KotlinDocRenderer
+
+
+class TimedObjectIndex(indexer.KotlinObjectIndex):
+    """KotlinObjectIndex which adds up the time spent in it."""
+
+    elapsed = 0.0
+
+    def __init__(self, *args, **kwargs):
+        start = time.perf_counter()
+        super(TimedObjectIndex, self).__init__(*args, **kwargs)
+        TimedObjectIndex.elapsed += time.perf_counter() - start
+
+
+def build_index(path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return KotlinFileIndex([path])
+
+
+def walk(symbols):
+    for item in symbols:
+        yield item
+        for child in walk(item['children']):
+            yield child
+
+
+def bench_index(path, repeat):
+    index_times = []
+    object_times = []
+    indexer.KotlinObjectIndex = TimedObjectIndex
+    try:
+        for run in range(repeat):
+            TimedObjectIndex.elapsed = 0.0
+            start = time.perf_counter()
+            file_index = build_index(path)
+            index_times.append(time.perf_counter() - start)
+            object_times.append(TimedObjectIndex.elapsed)
+    finally:
+        indexer.KotlinObjectIndex = TimedObjectIndex.__bases__[0]
+
+    symbols = list(walk(file_index.index))
+    members = sum(len(item['members'].index) for item in symbols if 'members' in item)
+    return file_index, {
+        'KotlinFileIndex': {'seconds': min(index_times), 'symbols': len(symbols)},
+        'KotlinObjectIndex': {'seconds': min(object_times), 'members': members},
+    }
+
+
+def bench_render(file_index, repeat):
+    docstrings = []
+    for item in walk(file_index.index):
+        docstrings.append((item['docstring'], item['type'] != 'fun'))
+        if 'members' in item:
+            docstrings.extend((member['docstring'], False) for member in item['members'].index)
+
+    times = []
+    for run in range(repeat):
+        # a new renderer every run, repeated blocks are only memoized within it
+        renderer = KotlinDocRenderer()
+        start = time.perf_counter()
+        lines = 0
+        for docstring, is_class in docstrings:
+            lines += len(renderer.render(docstring, is_class))
+        times.append(time.perf_counter() - start)
+    return {'seconds': min(times), 'blocks': len(docstrings), 'unique_blocks': len(renderer.cache), 'lines': lines}
+
+
+def bench_memory(path):
+    tracemalloc.start()
+    file_index = build_index(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del file_index
+    return {'peak_bytes': peak}
+
+
+def bench_end_to_end(path, output, repeat, extra_args):
+    command = [sys.executable, '-m', 'kotlin_domain.generator', path, output,
+               '--overwrite', '--no-cache'] + extra_args
+    times = []
+    peaks = []
+    for run in range(repeat):
+        shutil.rmtree(output, ignore_errors=True)
+        start = time.perf_counter()
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+        if hasattr(os, 'wait4'):
+            pid, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            # kilobytes on Linux
+            peaks.append(usage.ru_maxrss)
+        else:
+            process.wait()
+        times.append(time.perf_counter() - start)
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, command)
+
+    result = {'seconds': min(times), 'args': extra_args}
+    if peaks:
+        result['peak_rss_kb'] = max(peaks)
+    return result
+
+
+def compare(results, previous):
+    print(('Compared with {} ({})'.format(previous['version'], previous['date'])))
+    for name, result in sorted(results['results'].items()):
+        old = previous['results'].get(name)
+        if not old:
+            continue
+        for key in ('seconds', 'peak_bytes', 'peak_rss_kb'):
+            if key in result and old.get(key):
+                print(('  {:26} {:12} {:8.2f}x'.format(name, key, float(result[key]) / old[key])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark kotlinsphinx on a generated corpus.')
+    parser.add_argument('--output', type=str, default='benchmark.json', help='JSON file to save the results to')
+    parser.add_argument('--compare', type=str, default=None, help='JSON file of a previous run to compare with')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of every benchmark, the fastest is kept')
+    parser.add_argument('--keep', type=str, default=None, help='Write the corpus to this path and keep it')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    params = dict((key, getattr(args, key)) for key in default_params)
+    work_dir = tempfile.mkdtemp(prefix='kotlinsphinx-bench-')
+    try:
+        source_path = args.keep or os.path.join(work_dir, 'src')
+        files = KotlinCorpus(**params).write(source_path)
+        lines = 0
+        for file in files:
+            with io.open(file, encoding='utf-8') as fp:
+                lines += sum(1 for line in fp)
+        print(('Corpus: {} files, {} lines'.format(len(files), lines)))
+
+        file_index, results = bench_index(source_path, args.repeat)
+        results['doc_block_to_rst'] = bench_render(file_index, args.repeat)
+        del file_index
+        results['memory'] = bench_memory(source_path)
+        output_path = os.path.join(work_dir, 'rst')
+        results['kotlinsphinx'] = bench_end_to_end(source_path, output_path, args.repeat, [])
+        results['kotlinsphinx_all_members'] = bench_end_to_end(
+            source_path, output_path, args.repeat, ['--private', '--undoc-members'])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'version': __version__,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'corpus': dict(params, source_files=len(files), source_lines=lines),
+        'results': results,
+    }
+    for name, result in sorted(results.items()):
+        print(('{:26} {}'.format(name, json.dumps(result, sort_keys=True))))
+
+    with io.open(args.output, mode='w', encoding='utf-8') as fp:
+        fp.write(json.dumps(report, indent=2, sort_keys=True))
+    print(('Results saved to {}'.format(args.output)))
+
+    if args.compare:
+        with io.open(args.compare, encoding='utf-8') as fp:
+            compare(report, json.load(fp))
+
+
+if __name__ == "__main__":
+    main()
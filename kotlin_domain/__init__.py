@@ -1 +1,3 @@
+__version__ = '0.1'
+
 from .kotlin import *
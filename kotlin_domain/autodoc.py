@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  Directives documenting Kotlin sources during the Sphinx build
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import hashlib
+import io
+import os
+import types
+
+from docutils import nodes
+from docutils.parsers.rst import directives
+from docutils.statemachine import StringList
+
+from sphinx.util import logging
+from sphinx.util.docutils import SphinxDirective
+from sphinx.util.nodes import nested_parse_with_titles
+
+from .indexer import KotlinFileIndex, drop_raw
+from .render import document
+
+logger = logging.getLogger(__name__)
+
+
+def get_sources(env):
+    # path -> ((mtime, size), sha1, symbols), pickled with the environment
+    if not hasattr(env, 'kotlin_sources'):
+        env.kotlin_sources = {}
+    return env.kotlin_sources
+
+
+def index_source(env, path):
+    """
+    Symbols of a Kotlin file. The file is parsed again only when its
+    content hash changes, the hash is only computed when the modification
+    time or the size changes.
+    """
+    sources = get_sources(env)
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    entry = sources.get(path)
+    if entry and entry[0] == key:
+        return entry[2]
+
+    with io.open(path, mode='rb') as fp:
+        data = fp.read()
+    digest = hashlib.sha1(data).hexdigest()
+    if entry and entry[1] == digest:
+        symbols = entry[2]
+    else:
+        symbols = KotlinFileIndex.parse_data(path, data)
+        drop_raw(symbols)
+    sources[path] = (key, digest, symbols)
+    return symbols
+
+
+def merge_sources(app, env, docnames, other):
+    get_sources(env).update(get_sources(other))
+
+
+def prune_sources(app, env, docnames):
+    sources = get_sources(env)
+    for path in list(sources):
+        if not os.path.exists(path):
+            del sources[path]
+
+
+class KotlinAutoDirective(SphinxDirective):
+    """Base of the directives which document parsed Kotlin sources."""
+
+    required_arguments = 1
+    optional_arguments = 0
+    final_argument_whitespace = False
+    has_content = False
+    option_spec = {
+        'private': directives.flag,
+        'undoc-members': directives.flag,
+        'no-members': directives.flag,
+        'noindex': directives.flag,
+        'noindex-members': directives.flag,
+    }
+
+    def search_path(self):
+        return [os.path.normpath(os.path.join(self.env.srcdir, path))
+                for path in self.config.kotlin_search_path]
+
+    def find_file(self, filename):
+        if os.path.isabs(filename):
+            return filename if os.path.isfile(filename) else None
+        for path in self.search_path():
+            candidate = os.path.join(path, filename)
+            if os.path.isfile(candidate):
+                return candidate
+        return None
+
+    def document_options(self):
+        # same options as the command line generator
+        return types.SimpleNamespace(
+            private='private' in self.options,
+            undoc='undoc-members' in self.options,
+            members='no-members' not in self.options,
+            noindex='noindex' in self.options,
+            noindex_members='noindex-members' in self.options,
+        )
+
+    def render(self, path, members):
+        fp = io.StringIO()
+        document(members, self.document_options(), path, fp, '')
+        content = StringList(fp.getvalue().splitlines(), source=path)
+
+        node = nodes.section()
+        node.document = self.state.document
+        nested_parse_with_titles(self.state, content, node)
+        return node.children
+
+    def warning(self, message):
+        logger.warning(message, location=self.get_location())
+        return []
+
+
+class KotlinAutoFile(KotlinAutoDirective):
+    """Documents all declarations of a Kotlin file."""
+
+    def run(self):
+        path = self.find_file(self.arguments[0])
+        if path is None:
+            return self.warning('Kotlin source {} not found'.format(self.arguments[0]))
+
+        self.env.note_dependency(path)
+        return self.render(path, index_source(self.env, path))
+
+
+class KotlinAutoClass(KotlinAutoDirective):
+    """Documents one declaration, nested ones are given as Outer.Inner."""
+
+    option_spec = dict(KotlinAutoDirective.option_spec, file=directives.unchanged)
+
+    def run(self):
+        name = self.arguments[0]
+        if 'file' in self.options:
+            path = self.find_file(self.options['file'])
+            if path is None:
+                return self.warning('Kotlin source {} not found'.format(self.options['file']))
+            files = [path]
+        else:
+            files = sorted(KotlinFileIndex.find_files(self.search_path()))
+
+        for path in files:
+            item = find_symbol(index_source(self.env, path), name.split('.'))
+            if item is not None:
+                self.env.note_dependency(path)
+                return self.render(path, [item])
+
+        # the declaration may be added to any of the files
+        for path in files:
+            self.env.note_dependency(path)
+        return self.warning('Kotlin declaration {} not found'.format(name))
+
+
+def find_symbol(symbols, parts):
+    for item in symbols:
+        if item['type'] != 'fun' and item['name'] == parts[0]:
+            if len(parts) == 1:
+                return item
+            return find_symbol(item['children'], parts[1:])
+    return None
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  Persistent parse cache for the Kotlin indexer
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import hashlib
+import io
+import os
+import pickle
+
+from . import __version__
+from .indexer import KotlinFileIndex
+
+# bump when the indexer output changes without a package version change
+format_version = 4
+
+
+class KotlinParseCache(object):
+    """
+    On-disk cache of the per-file symbol lists built by KotlinFileIndex.
+
+    Every source file gets its own entry, keyed on the file path, size,
+    modification time, content hash, the package version and the settings
+    of the parser.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            pass
+
+    def entry_path(self, file):
+        name = hashlib.sha1(os.path.abspath(file).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, name + '.pickle')
+
+    @staticmethod
+    def make_key(file, data):
+        stat = os.stat(file)
+        return (
+            __version__,
+            format_version,
+            os.path.abspath(file),
+            stat.st_size,
+            stat.st_mtime_ns,
+            hashlib.sha1(data).hexdigest(),
+            KotlinFileIndex.parse_settings(),
+        )
+
+    def load(self, file, data):
+        try:
+            with io.open(self.entry_path(file), mode='rb') as fp:
+                key, symbols = pickle.load(fp)
+        except Exception:
+            self.misses += 1
+            return None
+
+        if key != self.make_key(file, data):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return symbols
+
+    def store(self, file, data, symbols):
+        path = self.entry_path(file)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with io.open(tmp_path, mode='wb') as fp:
+            pickle.dump((self.make_key(file, data), symbols), fp, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def stats(self):
+        return 'Parse cache: {} hits, {} misses'.format(self.hits, self.misses)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  Discovery of the Kotlin sources in a directory tree
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import concurrent.futures
+import fnmatch
+import io
+import os
+import time
+
+# directories of tools and build systems which never hold sources to document
+default_excludes = ['.git', '.gradle', '.idea', 'node_modules']
+# a build directory is the output of Gradle only next to its build script or
+# at the search root, elsewhere it may be a package named build
+build_dir = 'build'
+build_scripts = ['build.gradle', 'build.gradle.kts']
+
+
+def match_glob(patterns, name, rel):
+    # patterns with a slash match the path relative to the search root
+    for pattern in patterns:
+        if fnmatch.fnmatchcase(rel if '/' in pattern else name, pattern):
+            return True
+    return False
+
+
+class GitIgnore(object):
+    """Rules of the .gitignore files found on the way down the tree."""
+
+    def __init__(self, rules=()):
+        # (base, pattern, negate, dir_only, anchored)
+        self.rules = list(rules)
+
+    def extend(self, path, base):
+        """Rules with the ones of the .gitignore in path added."""
+        try:
+            with io.open(os.path.join(path, '.gitignore'), encoding='utf-8') as fp:
+                lines = fp.read().splitlines()
+        except (IOError, OSError, UnicodeDecodeError):
+            return self
+
+        rules = list(self.rules)
+        for line in lines:
+            line = line.rstrip()
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            if line.startswith('**/'):
+                # matches at any depth, even with a slash in the rest
+                line = line[3:]
+                anchored = False
+            else:
+                # a slash anywhere but at the end anchors the pattern to the base
+                anchored = '/' in line
+            rules.append((base, line.lstrip('/'), negate, dir_only, anchored))
+        return GitIgnore(rules)
+
+    def ignored(self, rel, is_dir):
+        result = False
+        name = rel.rsplit('/', 1)[-1]
+        for base, pattern, negate, dir_only, anchored in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if base:
+                if not rel.startswith(base + '/'):
+                    continue
+                local = rel[len(base) + 1:]
+            else:
+                local = rel
+            if anchored:
+                matched = fnmatch.fnmatchcase(local, pattern)
+            elif '/' in pattern:
+                # **/a/b is a/b below the base or any of its subdirectories
+                matched = fnmatch.fnmatchcase(local, pattern) or fnmatch.fnmatchcase(local, '*/' + pattern)
+            else:
+                matched = fnmatch.fnmatchcase(name, pattern)
+            if matched:
+                result = not negate
+        return result
+
+
+class KotlinSourceFinder(object):
+    """
+    Finds the Kotlin sources below the search paths with os.scandir.
+
+    Directories matching an exclude glob or ignored by .gitignore are not
+    entered at all, neither are build outputs unless skip_build is False.
+    With several jobs the directories of one level of the tree are listed
+    by a thread pool, which helps on network filesystems.
+    """
+
+    def __init__(self, include=None, exclude=None, gitignore=False, jobs=1, skip_build=True):
+        self.include = include or ['*.kt']
+        self.exclude = default_excludes if exclude is None else exclude
+        self.gitignore = gitignore
+        self.skip_build = skip_build
+        self.jobs = jobs
+        self.elapsed = 0.0
+        self.directories = 0
+
+    @staticmethod
+    def list_dir(path):
+        dirs = []
+        files = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            dirs.append(entry.name)
+                        elif entry.is_file():
+                            files.append(entry.name)
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+        return sorted(dirs), sorted(files)
+
+    def find(self, search_path):
+        start = time.perf_counter()
+        files = []
+        for root in search_path:
+            files.extend(self.find_in(root))
+        self.elapsed += time.perf_counter() - start
+        return files
+
+    def find_in(self, root):
+        # (path, path relative to root, .gitignore rules)
+        level = [(root, '', GitIgnore())]
+        files = []
+        executor = None
+        if self.jobs > 1:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs)
+        try:
+            while level:
+                if executor is not None:
+                    listings = list(executor.map(self.list_dir, [path for path, rel, rules in level]))
+                else:
+                    listings = [self.list_dir(path) for path, rel, rules in level]
+                self.directories += len(level)
+
+                next_level = []
+                for (path, rel, rules), (dirs, names) in zip(level, listings):
+                    if self.gitignore and '.gitignore' in names:
+                        rules = rules.extend(path, rel)
+                    for name in names:
+                        child = rel + '/' + name if rel else name
+                        if not match_glob(self.include, name, child):
+                            continue
+                        if match_glob(self.exclude, name, child):
+                            continue
+                        if self.gitignore and rules.ignored(child, False):
+                            continue
+                        files.append(os.path.join(path, name))
+                    for name in dirs:
+                        child = rel + '/' + name if rel else name
+                        if match_glob(self.exclude, name, child):
+                            continue
+                        if self.is_build_output(name, rel, names):
+                            continue
+                        if self.gitignore and rules.ignored(child, True):
+                            continue
+                        next_level.append((os.path.join(path, name), child, rules))
+                level = next_level
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return sorted(files)
+
+    def is_build_output(self, name, rel, names):
+        # names are the files next to the directory
+        if not self.skip_build or name != build_dir:
+            return False
+        return not rel or any(script in names for script in build_scripts)
+
+    def stats(self, count):
+        return 'Found {} Kotlin files in {} directories in {:.3f} s'.format(
+            count, self.directories, self.elapsed)
@@ -22,109 +22,660 @@
 ################################################################################
 
 import argparse
+import collections
+import concurrent.futures
+import contextlib
+import io
+import json
 import os
-from .indexer import KotlinFileIndex, KotlinObjectIndex
+import sqlite3
+import sys
+import time
+from .indexer import KotlinFileIndex
+from .cache import KotlinParseCache
+from .manifest import KotlinManifest
+from .profile import KotlinProfile
+from .discovery import KotlinSourceFinder, default_excludes
+from .writer import KotlinDocumentWriter
+from .layout import KotlinLayout, layouts
+from .snapshot import KotlinSnapshot, KotlinSnapshotWriter
+from .store import KotlinSymbolStore
+from .render import document
 
-parser = argparse.ArgumentParser(description='Create reStructured text documentation from Kotlin code.')
+
+def add_document_arguments(parser):
+    # options of the generated documents
+    parser.add_argument('--private', dest='private', action='store_true', help='Include private and internal members', required=False, default=False)
+    parser.add_argument('--overwrite', dest='overwrite', action='store_true', help='Overwrite existing documentation', required=False, default=False)
+    parser.add_argument('--undoc-members', dest='undoc', action='store_true', help='Include members without documentation block', required=False, default=False)
+    parser.add_argument('--no-members', dest='members', action='store_false', help='Do not include member documentation', required=False, default=True)
+    parser.add_argument('--no-index', dest='noindex', action='store_true', help='Do not add anything to the index', required=False, default=False)
+    parser.add_argument('--no-index-members', dest='noindex_members', action='store_true', help='Do not add members to the index, just the toplevel items', required=False, default=False)
+    parser.add_argument('--layout', dest='layout', choices=layouts, help='Pages of the documentation: one per source file, per source directory, per top level declaration, or chosen by the size of the source (default: file)', required=False, default='file')
+    parser.add_argument('--min-page-size', dest='min_page_size', type=int, help='Sources rendered to fewer KB are gathered per directory by the adaptive layout (default: 4)', required=False, default=4)
+    parser.add_argument('--max-page-size', dest='max_page_size', type=int, help='Sources rendered to more KB are split per declaration by the adaptive layout (default: 256)', required=False, default=256)
+    parser.add_argument('--toc', dest='toc', action='store_true', help='Write an index.rst with a table of contents into every documentation directory', required=False, default=False)
+    parser.add_argument('--write-jobs', dest='write_jobs', type=int, help='Number of threads writing the documents (default: 4)', required=False, default=4)
+
+
+def add_index_arguments(parser, cache_dir='<documentation_path>/.kotlinsphinx'):
+    # options of the discovery and the parsing of the sources
+    parser.add_argument('--cache-dir', dest='cache_dir', type=str, help='Directory of the parse cache (default: {})'.format(cache_dir), required=False, default=None)
+    parser.add_argument('--include', dest='include', action='append', help='Glob of the sources to document, may be repeated (default: *.kt)', required=False, default=None)
+    parser.add_argument('--exclude', dest='exclude', action='append', help='Glob of the files and directories to skip, may be repeated', required=False, default=[])
+    parser.add_argument('--no-default-excludes', dest='default_excludes', action='store_false', help='Also search in {} and in build directories at the source path or next to a Gradle build script'.format(', '.join(default_excludes)), required=False, default=True)
+    parser.add_argument('--gitignore', dest='gitignore', action='store_true', help='Skip the files and directories ignored by .gitignore files in the source path', required=False, default=False)
+    parser.add_argument('--discovery-jobs', dest='discovery_jobs', type=int, help='Number of threads listing directories (default: 1)', required=False, default=1)
+    parser.add_argument('--mmap-threshold', dest='mmap_threshold', type=float, help='Memory map sources of this many MB or more and decode their lines on demand (default: 32)', required=False, default=32)
+    parser.add_argument('--doc-lookback', dest='doc_lookback', type=int, help='Lines searched upwards for the documentation block in memory mapped sources (default: 1000)', required=False, default=1000)
+    parser.add_argument('--no-cache', dest='cache', action='store_false', help='Do not use the parse cache', required=False, default=True)
+    parser.add_argument('--database', dest='database', type=str, help='Also keep the symbols in this SQLite database, see "kotlinsphinx query"', required=False, default=None)
+
+
+def add_common_arguments(parser):
+    parser.add_argument('--jobs', '-j', dest='jobs', type=int, help='Number of processes used to index files, 0 uses all cores (default: 1)', required=False, default=1)
+    parser.add_argument('--quiet', '-q', dest='quiet', action='store_true', help='Print a summary instead of a line for every file', required=False, default=False)
+
+
+parser = argparse.ArgumentParser(description='Create reStructured text documentation from Kotlin code.',
+                                 epilog='Run "kotlinsphinx index -h" and "kotlinsphinx render -h" for the two phase mode '
+                                        'and "kotlinsphinx query -h" to search a symbol database.')
 parser.add_argument('source_path', type=str, help='Path to Kotlin files')
 parser.add_argument('documentation_path', type=str, help='Path to generate the documentation in')
-parser.add_argument('--private', dest='private', action='store_true', help='Include private and internal members', required=False, default=False)
-parser.add_argument('--overwrite', dest='overwrite', action='store_true', help='Overwrite existing documentation', required=False, default=False)
-parser.add_argument('--undoc-members', dest='undoc', action='store_true', help='Include members without documentation block', required=False, default=False)
-parser.add_argument('--no-members', dest='members', action='store_false', help='Do not include member documentation', required=False, default=True)
-parser.add_argument('--no-index', dest='noindex', action='store_true', help='Do not add anything to the index', required=False, default=False)
-parser.add_argument('--no-index-members', dest='noindex_members', action='store_true', help='Do not add members to the index, just the toplevel items', required=False, default=False)
+add_document_arguments(parser)
+add_index_arguments(parser)
+add_common_arguments(parser)
+parser.add_argument('--incremental', dest='incremental', action='store_true', help='Regenerate documentation only for changed sources and remove documentation of deleted ones', required=False, default=False)
+parser.add_argument('--stream', dest='stream', action='store_true', help='Parse, write and release the sources one at a time to keep memory use flat', required=False, default=False)
+parser.add_argument('--profile', dest='profile', type=str, help='Write a JSON report of the time and memory used by every phase and source file', required=False, default=None)
+parser.add_argument('--profile-top', dest='profile_top', type=int, help='Number of the slowest files listed in the profile (default: 10)', required=False, default=10)
+parser.add_argument('--watch', dest='watch', action='store_true', help='Keep running and update the documentation when sources change', required=False, default=False)
+parser.add_argument('--watch-interval', dest='watch_interval', type=float, help='Seconds between the checks for changed sources (default: 0.5)', required=False, default=0.5)
+
+index_parser = argparse.ArgumentParser(prog='kotlinsphinx index', description='Index Kotlin sources into a symbol snapshot.')
+index_parser.add_argument('source_path', type=str, help='Path to Kotlin files')
+index_parser.add_argument('snapshot', type=str, help='Snapshot file to write')
+add_index_arguments(index_parser, '<snapshot directory>/.kotlinsphinx')
+add_common_arguments(index_parser)
+
+render_parser = argparse.ArgumentParser(prog='kotlinsphinx render', description='Create reStructured text documentation from a symbol snapshot.')
+render_parser.add_argument('snapshot', type=str, help='Snapshot file written by kotlinsphinx index')
+render_parser.add_argument('documentation_path', type=str, help='Path to generate the documentation in')
+add_document_arguments(render_parser)
+add_common_arguments(render_parser)
+
+query_parser = argparse.ArgumentParser(prog='kotlinsphinx query', description='Search the symbols of a database written with --database.')
+query_parser.add_argument('database', type=str, help='SQLite database written with --database')
+query_parser.add_argument('name', type=str, nargs='?', help='Name, qualified name or full name with the package of the symbol, may be a glob like "Feature.*"', default=None)
+query_parser.add_argument('--search', '-s', dest='search', type=str, help='Full text search in the names and the documentation', required=False, default=None)
+query_parser.add_argument('--type', dest='type', type=str, help='Only symbols of this type, like class, data_class or fun', required=False, default=None)
+query_parser.add_argument('--scope', dest='scope', type=str, help='Only symbols of this scope, like public or internal', required=False, default=None)
+query_parser.add_argument('--package', dest='package', type=str, help='Only symbols of this package and its subpackages', required=False, default=None)
+query_parser.add_argument('--limit', dest='limit', type=int, help='Maximum number of symbols printed (default: 50)', required=False, default=50)
+query_parser.add_argument('--json', dest='json', action='store_true', help='Print the symbols with their parameters and documentation as JSON', required=False, default=False)
+
+
+class KotlinOverwriteError(Exception):
+    """A page would replace documentation the generator did not write."""
 
-# TODO: https://kotlinlang.org/api/latest/jvm/stdlib/kotlin/-string/index.html
-# TODO: https://kotlinlang.org/api/latest/jvm/stdlib/kotlin/-unit/index.html
 
 def main():
-    args = parser.parse_args()
+    commands = {'index': index_main, 'render': render_main, 'query': query_main}
+    command, argv = generate_main, sys.argv[1:]
+    if argv and argv[0] in commands:
+        command, argv = commands[argv[0]], argv[1:]
+    try:
+        return command(argv)
+    except KotlinOverwriteError as exc:
+        print(("ERROR: {}".format(exc)))
+        sys.exit(1)
+
+
+def generate_main(argv):
+    """Index the sources and write their documentation."""
+    args = parser.parse_args(argv)
+    if args.watch and args.stream:
+        parser.error('--watch keeps the index in memory and can not be used with --stream')
     source_path = os.path.abspath(args.source_path)
-    file_index = KotlinFileIndex([source_path])
+    configure_indexer(args)
+
+    profile = None
+    if args.profile:
+        profile = KotlinProfile(args.profile_top)
+
+    cache = get_cache(args, os.path.join(args.documentation_path, '.kotlinsphinx'))
+    store = get_store(args)
+
+    finder = get_finder(args)
+    with phase(profile, 'discover'):
+        files = KotlinFileIndex.find_files([source_path], finder)
+    print(finder.stats(len(files)))
+    outdated = files
+    manifest = None
+    known_outputs = set()
+    layout = get_layout(args, source_path)
+    # outputs of the sources processed again, removed if not written again
+    previous = set()
+    if args.incremental:
+        manifest = KotlinManifest(
+            os.path.join(args.documentation_path, '.kotlinsphinx', 'manifest.json'),
+            get_options(args, source_path))
+        known_outputs = manifest.outputs()
+
+        digests = {}
+        outdated = []
+        with phase(profile, 'changes'):
+            for file in files:
+                source = os.path.relpath(file, source_path)
+                digests[source] = KotlinManifest.digest(file)
+                if not manifest.is_current(source, digests[source], args.documentation_path):
+                    outdated.append(file)
+                elif store is not None and not store.is_current(file):
+                    # not yet in the database
+                    outdated.append(file)
+
+        # documentation of deleted sources is removed unless another
+        # source writes to the same page
+        deleted = sorted(set(manifest.sources) - set(digests))
+        for source in deleted:
+            if not args.quiet:
+                print(("Removing documentation for '{}'...".format(source)))
+            previous.update(manifest.remove(source))
+
+        print(("{} of {} files changed".format(len(outdated), len(files))))
+
+        if layout.aggregates:
+            outdated = directory_sources(files, [os.path.join(source_path, source) for source in deleted] + outdated)
+
+        for file in outdated:
+            entry = manifest.sources.get(os.path.relpath(file, source_path))
+            if entry:
+                previous.update(entry['outputs'])
+
+    if args.stream:
+        # parse, write and release one file at a time
+        documents = KotlinFileIndex.iter_files(outdated, cache=cache, jobs=args.jobs, keep_raw=False, profile=profile)
+        candidates = outdated
+    else:
+        file_index = KotlinFileIndex([source_path], cache=cache, jobs=args.jobs, files=outdated, keep_raw=False, profile=profile)
+        documents = list(file_index.by_file().items())
+        candidates = [file for file, members in documents]
 
     try:
         os.makedirs(args.documentation_path)
     except:
         pass
 
-    # check for overwrite
-    for file, members in list(file_index.by_file().items()):
-        destfile = get_dest_file(file, args.source_path, args.documentation_path)
-        if os.path.exists(destfile) and not args.overwrite:
-            print(("""ERROR: {} already exists, to overwrite existing
-                     documentation use the '--overwrite' flag""".format(file)))
-            exit(1)
-
-    for file, members in list(file_index.by_file().items()):
-        destfile = get_dest_file(file, args.source_path, args.documentation_path)
-        print(("Writing documentation for '{}'...".format(os.path.relpath(file, source_path))))
+    # check for overwrite, the streaming mode does not know yet which
+    # sources have symbols and checks all of them, pages not known in
+    # advance are checked when they are written
+    for file in candidates:
+        for output in layout.expected_outputs(file):
+            check_overwrite(args, output, known_outputs)
+
+    outputs = {}
+    writer = KotlinDocumentWriter(args.write_jobs)
+    layout.expect(candidates)
+    if store is not None:
+        documents = stored(documents, store)
+    written = write_pages(iter_rendered(documents, args, source_path, profile), layout, writer, args,
+                          outputs, known_outputs, profile)
+    if store is not None:
+        with phase(profile, 'database'):
+            close_store(store, outdated, files)
+
+    if cache is not None:
+        print(cache.stats())
+    if args.quiet:
+        # the sources of the expanded directories may come from the cache
+        parsed = cache.misses if cache is not None else len(outdated)
+        print(("{} files parsed, {} loaded from the cache, {} documents written".format(
+            parsed, len(outdated) - parsed, written)))
+
+    if manifest is not None:
+        with phase(profile, 'manifest'):
+            for file in outdated:
+                source = os.path.relpath(file, source_path)
+                manifest.update(source, digests[source], outputs.get(file, []))
+            remove_stale(args, previous - manifest.outputs())
+            if args.toc:
+                manifest.indexes = write_indexes(args, layout, manifest.source_outputs(), manifest.indexes, known_outputs)
+            manifest.save()
+    elif args.toc:
+        write_indexes(args, layout, set(output for file_outputs in outputs.values() for output in file_outputs),
+                      [], known_outputs)
+
+    if profile is not None:
+        report = profile.report()
+        profile.save(args.profile, report)
+        for line in profile.summary(report):
+            print(line)
+        print(("Profile saved to {}".format(args.profile)))
+
+    if args.watch:
+        watch(args, source_path, file_index, cache, manifest, layout, outputs, known_outputs)
+
+
+def index_main(argv):
+    """Index the sources and save their symbols in a snapshot."""
+    args = index_parser.parse_args(argv)
+    source_path = os.path.abspath(args.source_path)
+    configure_indexer(args)
+    cache = get_cache(args, os.path.join(os.path.dirname(os.path.abspath(args.snapshot)), '.kotlinsphinx'))
+
+    finder = get_finder(args)
+    files = KotlinFileIndex.find_files([source_path], finder)
+    print(finder.stats(len(files)))
+
+    store = get_store(args)
+    documents = KotlinFileIndex.iter_files(files, cache=cache, jobs=args.jobs, keep_raw=False)
+    if store is not None:
+        documents = stored(documents, store)
+    snapshot = KotlinSnapshotWriter(args.snapshot, source_path)
+    try:
+        for file, symbols in documents:
+            snapshot.add(file, symbols)
+    except BaseException:
+        snapshot.abort()
+        raise
+    snapshot.close()
+    if store is not None:
+        close_store(store, files, files)
+
+    if cache is not None:
+        print(cache.stats())
+    print(("Snapshot of {} files with {} symbols written to {}".format(
+        len(files), snapshot.symbols, args.snapshot)))
+
+
+def render_main(argv):
+    """Write the documentation of the symbols saved in a snapshot."""
+    args = render_parser.parse_args(argv)
+    try:
+        snapshot = KotlinSnapshot(args.snapshot)
+    except (IOError, OSError, ValueError) as exc:
+        render_parser.error(str(exc))
+    source_path = snapshot.source_path
+    layout = get_layout(args, source_path)
+
+    try:
+        os.makedirs(args.documentation_path)
+    except OSError:
+        pass
+
+    known_outputs = set()
+    for file in snapshot.files:
+        for output in layout.expected_outputs(file):
+            check_overwrite(args, output, known_outputs)
+
+    outputs = {}
+    layout.expect(snapshot.files)
+    written = write_pages(iter_rendered(iter(snapshot), args, source_path), layout,
+                          KotlinDocumentWriter(args.write_jobs), args, outputs, known_outputs)
+    if args.toc:
+        write_indexes(args, layout, set(output for file_outputs in outputs.values() for output in file_outputs),
+                      [], known_outputs)
+    if args.quiet:
+        print(("{} files rendered, {} documents written".format(len(snapshot.files), written)))
+
+
+def query_main(argv):
+    """Print the symbols of a database which match the query."""
+    args = query_parser.parse_args(argv)
+    if not (args.name or args.search or args.type or args.scope or args.package):
+        query_parser.error('give a name, --search or a filter')
+    if not os.path.exists(args.database):
+        query_parser.error('{} does not exist'.format(args.database))
+    try:
+        store = KotlinSymbolStore(args.database, readonly=True)
+    except (ValueError, sqlite3.DatabaseError) as exc:
+        query_parser.error(str(exc))
+    try:
+        rows = store.query(args.name, args.search, args.type, args.scope, args.package, args.limit)
+    except sqlite3.OperationalError as exc:
+        # like a malformed full text query
+        query_parser.error(str(exc))
+    finally:
+        store.close()
+
+    if args.json:
+        print((json.dumps(rows, indent=2)))
+        return
+    for row in rows:
+        print(('{}:{}: {} {} {}{}'.format(row['path'], row['line'], row['scope'], row['type'],
+                                          row['fullname'], row['signature'] or '')))
+
+
+def configure_indexer(args):
+    KotlinFileIndex.configure({
+        'verbose': not args.quiet,
+        'mmap_threshold': int(args.mmap_threshold * 1024 * 1024),
+        'doc_lookback': args.doc_lookback,
+    })
+
+
+def get_cache(args, default_dir):
+    if not args.cache:
+        return None
+    return KotlinParseCache(args.cache_dir or default_dir)
+
+
+def get_store(args):
+    if not args.database:
+        return None
+    return KotlinSymbolStore(args.database)
+
+
+def stored(documents, store):
+    # save the symbols of the changed sources on the way to the rendering
+    for file, symbols in documents:
+        if not store.is_current(file):
+            store.update(file, symbols)
+        yield file, symbols
+
+
+def close_store(store, processed, files):
+    # sources without symbols do not come with the documents
+    for file in processed:
+        if not store.is_current(file):
+            store.update(file, [])
+    store.retain(files)
+    print(store.stats())
+    store.close()
+
+
+def get_finder(args):
+    exclude = list(args.exclude)
+    if args.default_excludes:
+        exclude = default_excludes + exclude
+    return KotlinSourceFinder(args.include, exclude, args.gitignore, args.discovery_jobs, args.default_excludes)
+
+
+def snapshot(source_path, finder):
+    state = {}
+    for file in KotlinFileIndex.find_files([source_path], finder):
         try:
-            os.makedirs(os.path.dirname(destfile))
-        except:
-            pass
-        with open(destfile, "w") as fp:
-            heading = 'Documentation for {}'.format(os.path.relpath(file, source_path))
-            fp.write(heading + '\n')
-            fp.write(('=' * len(heading)) + '\n\n\n')
-            document(members, args, file, fp, '')
-
-
-def get_dest_file(filename, search_path, doc_path):
-    rel = os.path.relpath(filename, search_path)
-    return os.path.join(doc_path, rel)[:-3] + '.rst'
-
-def document(members, args, file, fp, indent):
-    for member in members:
-        add = True
-        if args.undoc is False and len(member['docstring']) == 0:
-            add = False
-        if args.private is False and member['scope'] != 'public':
-            add = False
-        if not add:
-            # print 'Skip documentation for ' + member['name']
+            stat = os.stat(file)
+        except OSError:
             continue
+        state[file] = (stat.st_mtime_ns, stat.st_size)
+    return state
+
+
+def watch(args, source_path, file_index, cache, manifest, layout, outputs, known_outputs):
+    # poll the tree and patch the index and the documents of changed sources
+    if manifest is not None:
+        for source, entry in manifest.sources.items():
+            outputs.setdefault(os.path.join(source_path, source), entry['outputs'])
+    indexes = manifest.indexes if manifest is not None else []
+
+    finder = get_finder(args)
+    state = snapshot(source_path, finder)
+    print(("Watching {} for changes, press Ctrl+C to stop".format(source_path)))
+    try:
+        while True:
+            time.sleep(args.watch_interval)
+            current = snapshot(source_path, finder)
+            changed = sorted(file for file in current if state.get(file) != current[file])
+            removed = sorted(set(state) - set(current))
+            state = current
+            if not changed and not removed:
+                continue
+
+            start = time.perf_counter()
+            file_index.update_files([], removed, cache)
+            failed = watch_parse(source_path, file_index, changed, cache)
+            affected = changed
+            if layout.aggregates:
+                # the index of an incremental run lacks the unchanged
+                # sources, the ones of the affected directories come from
+                # the cache
+                affected = directory_sources(sorted(current), changed + removed + failed)
+                known = set(file_index.files)
+                failed += watch_parse(source_path, file_index,
+                                      [file for file in affected if file not in known], cache)
+            for file in failed:
+                # deleted since the poll, or not readable yet, it is handled
+                # as removed and tried again when it comes back
+                state.pop(file, None)
+                if file in changed:
+                    changed.remove(file)
+                removed.append(file)
+            affected = [file for file in affected if file not in failed]
+            by_file = file_index.by_file()
+            symbols = dict((file, by_file.get(file, [])) for file in affected)
+
+            previous = set()
+            for file in removed:
+                if not args.quiet:
+                    print(("Removing documentation for '{}'...".format(os.path.relpath(file, source_path))))
+                previous.update(outputs.pop(file, []))
+                source = os.path.relpath(file, source_path)
+                if manifest is not None and source in manifest.sources:
+                    manifest.remove(source)
+            for file in affected:
+                previous.update(outputs.pop(file, []))
+
+            layout.expect(affected)
+            documents = [(file, symbols[file]) for file in affected]
+            try:
+                write_pages(iter_rendered(documents, args, source_path, jobs=1), layout,
+                            KotlinDocumentWriter(args.write_jobs), args, outputs, known_outputs)
+            except KotlinOverwriteError as exc:
+                # keep watching, the page is written once it is moved away
+                # and the source changes again
+                print(("ERROR: {}".format(exc)))
+            current_outputs = set(output for file_outputs in outputs.values() for output in file_outputs)
+            remove_stale(args, previous - current_outputs)
+
+            if manifest is not None:
+                for file in affected:
+                    source = os.path.relpath(file, source_path)
+                    try:
+                        manifest.update(source, KotlinManifest.digest(file), outputs.get(file, []))
+                    except OSError:
+                        # deleted meanwhile, the next poll removes it
+                        state.pop(file, None)
+            if args.toc:
+                try:
+                    indexes = write_indexes(args, layout, current_outputs, indexes, known_outputs)
+                except KotlinOverwriteError as exc:
+                    print(("ERROR: {}".format(exc)))
+            if manifest is not None:
+                manifest.indexes = indexes
+                manifest.save()
+            print(("{} changed, {} removed, updated in {:.3f} s".format(
+                len(changed), len(removed), time.perf_counter() - start)))
+    except KeyboardInterrupt:
+        print("Stopped watching")
+
+
+def watch_parse(source_path, file_index, files, cache):
+    """Parse the files into the index one by one, returns the ones which could not be read."""
+    failed = []
+    for file in files:
+        try:
+            file_index.update_files([file], [], cache)
+        except OSError as exc:
+            print(("Could not read '{}': {}".format(os.path.relpath(file, source_path), exc)))
+            file_index.update_files([], [file], cache)
+            failed.append(file)
+    return failed
+
 
-        doc = KotlinFileIndex.documentation(
-            member,
-            indent=indent,
-            nodocstring=args.undoc,
-            noindex=args.noindex
-        )
-        for line in doc:
-            content = indent + line + "\n"
-            fp.write(content)
+def directory_sources(files, changed):
+    # pages of the aggregating layouts gather all sources of a directory
+    directories = set(os.path.dirname(file) for file in changed)
+    return [file for file in files if os.path.dirname(file) in directories]
 
-        if args.members:
-            document_member(member, args, file, fp, indent)
-        fp.write('\n')
 
+def check_overwrite(args, output, known_outputs):
+    destfile = os.path.join(args.documentation_path, output)
+    if os.path.exists(destfile) and not args.overwrite and output not in known_outputs:
+        raise KotlinOverwriteError("""{} already exists, to overwrite existing
+                 documentation use the '--overwrite' flag""".format(destfile))
 
-def document_member(parent, args, file, fp, indent):
-    if 'members' not in parent:
+
+def write_pages(rendered, layout, writer, args, outputs, known_outputs, profile=None):
+    """
+    Lay the rendered sources out to pages and write them, adds the pages
+    of every source to outputs. Returns the number of changed pages.
+    """
+    def finished(done):
+        # the pages come back in the order they were submitted
+        count = 0
+        for page, destfile, changed, seconds in done:
+            if profile is not None:
+                profile.add('write', seconds, file=page.sources[0] if page.sources else None)
+            if changed and not args.quiet:
+                print(("Writing documentation for '{}'...".format(page.label)))
+            count += changed
+        return count
+
+    def submit(pages):
+        count = 0
+        for page in pages:
+            check_overwrite(args, page.output, known_outputs)
+            known_outputs.add(page.output)
+            for file in page.sources:
+                outputs.setdefault(file, []).append(page.output)
+            destfile = os.path.join(args.documentation_path, page.output)
+            count += finished(writer.submit(page, destfile, page.text))
+        return count
+
+    written = 0
+    try:
+        for file, members, items in rendered:
+            written += submit(layout.add(file, items))
+        written += submit(layout.close())
+    except BaseException:
+        # let the queued pages finish before the error goes on
+        writer.close()
+        layout.close()
+        raise
+    return written + finished(writer.close())
+
+
+def write_indexes(args, layout, source_outputs, previous, known_outputs):
+    """Write the tables of contents of the pages, returns their outputs."""
+    pages = layout.index_pages(source_outputs)
+    for page in pages:
+        # a source named index.kt has the page of the table of contents
+        if page.output in source_outputs:
+            raise KotlinOverwriteError("""{} is the page of a source, the table of contents
+                 of --toc can not be written there, rename the source or leave out '--toc'""".format(
+                os.path.join(args.documentation_path, page.output)))
+    writer = KotlinDocumentWriter(args.write_jobs)
+    for page in pages:
+        check_overwrite(args, page.output, known_outputs)
+        known_outputs.add(page.output)
+        writer.submit(page, os.path.join(args.documentation_path, page.output), page.text)
+    writer.close()
+
+    indexes = sorted(page.output for page in pages)
+    remove_stale(args, set(previous) - set(indexes) - set(source_outputs))
+    return indexes
+
+
+def remove_stale(args, stale):
+    # pages which are no longer written by any source
+    for output in sorted(stale):
+        try:
+            os.remove(os.path.join(args.documentation_path, output))
+        except OSError:
+            pass
+        # and the directories left empty, like the ones of the class layout
+        directory = os.path.dirname(output)
+        while directory:
+            try:
+                os.rmdir(os.path.join(args.documentation_path, directory))
+            except OSError:
+                break
+            directory = os.path.dirname(directory)
+
+
+def phase(profile, name, file=None):
+    if profile is None:
+        return contextlib.nullcontext()
+    return profile.phase(name, file)
+
+
+def render_items(file, members, args, profile=None):
+    """
+    Render every top level declaration on its own, returns their (name,
+    type, text) for the layout to put on pages. The text is empty for
+    declarations which are not documented.
+    """
+    items = []
+    with phase(profile, 'render', file):
+        for member in members:
+            fp = io.StringIO()
+            document([member], args, file, fp, '')
+            items.append((member['name'], member['type'], fp.getvalue()))
+    return items
+
+
+def render_timed(file, members, args):
+    # runs in the worker processes, which can not trace the memory
+    start = time.perf_counter()
+    items = render_items(file, members, args)
+    return items, time.perf_counter() - start
+
+
+def iter_rendered(documents, args, source_path, profile=None, jobs=None):
+    """
+    Render the documents of the sources and yield (file, members, items)
+    in the order of documents. With several jobs the documents are
+    rendered by worker processes, at most two per job ahead.
+    """
+    if jobs is None:
+        jobs = args.jobs
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    if jobs <= 1:
+        for file, members in documents:
+            if profile is not None:
+                profile.count(members)
+            yield file, members, render_items(file, members, args, profile)
         return
-    for member in parent['members'].index:
-        add = True
-
-        # Always document enum cases
-        if args.undoc is False and len(member['docstring']) == 0 and member['type'] != 'enum_case':
-            add = False
-        if args.private is False and member['scope'] != 'public':
-            add = False
-        if not add:
-            continue
 
-        doc = KotlinObjectIndex.documentation(
-            member,
-            indent=indent,
-            nodocstring=False,
-            noindex=(args.noindex or args.noindex_members)
-        )
-        for line in doc:
-            content = indent + '   ' + line + "\n"
-            fp.write(content)
-
-    document(parent['children'], args, file, fp, indent + '   ')
+    def collect(task):
+        file, members, future = task
+        items, seconds = future.result()
+        if profile is not None:
+            profile.add('render', seconds, file=file)
+        return file, members, items
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = collections.deque()
+        for file, members in documents:
+            if profile is not None:
+                profile.count(members)
+            pending.append((file, members, executor.submit(render_timed, file, members, args)))
+            if len(pending) >= jobs * 2:
+                yield collect(pending.popleft())
+        while pending:
+            yield collect(pending.popleft())
+
+
+def get_layout(args, source_path):
+    return KotlinLayout(args.layout, source_path, args.min_page_size * 1024, args.max_page_size * 1024)
+
+
+def get_options(args, source_path):
+    # options which change the generated documents
+    return {
+        'source_path': source_path,
+        'private': args.private,
+        'undoc': args.undoc,
+        'members': args.members,
+        'noindex': args.noindex,
+        'noindex_members': args.noindex_members,
+        'layout': args.layout,
+        'min_page_size': args.min_page_size,
+        'max_page_size': args.max_page_size,
+    }
 
 
 if __name__ == "__main__":
@@ -23,8 +23,16 @@
 
 import re
 import os
-import fnmatch
 import io
+import mmap
+import collections
+import concurrent.futures
+import time
+import tracemalloc
+
+from .lexer import KotlinDocIndex, KotlinLines, scan
+from .records import KotlinSymbol, KotlinMember
+from .discovery import KotlinSourceFinder
 
 # member patterns
 func_pattern = re.compile(r'\s*(?P<scope>private\s+|public\s+|external\s+|open\s+|internal\s+|protected\s+)?(?P<type>fun)\s+(?P<template><T>)?\s*(?P<name>[a-zA-Z_][a-zA-Z0-9_.]*\b)(?P<rest>[^{]*)')
@@ -55,9 +63,10 @@ def interface_sig(name=r'[a-zA-Z_][a-zA-Z0-9_]*'):
 def extension_sig(name=r'[a-zA-Z_][a-zA-Z0-9_]*'):
     return re.compile(r'\s*(?P<scope>private\s+|public\s+|open\s+|internal\s+|protected\s+)?(?P<struct>extension)\s+(?P<name>' + name + r'\b)(\s*:\s*(?P<type>[^{]*))*(?P<rest>[^{]*)')
 
-# brace balancing for determining in which depth we are
-string_pattern = re.compile(r'"(?:[^"\\]*(?:\\.)?)*"')
-line_comment_pattern = re.compile(r'(// .*$)')
+# accepts every line one of the signatures above can match, the keyword
+# selects the signature to try
+declaration_pattern = re.compile(r'\s*(?:(?:private|public|open|internal|protected|external|final|inline|sealed)\s+)*(?P<keyword>class|object|enum|data|interface|extension|fun)\b')
+
 comment_pattern = re.compile(r'/\*(?:.)*\*/')
 author_pattern  = re.compile(r'^\s*@author\s*(?P<desc>.*)')
 example_pattern  = re.compile(r'^\s*@sample\s*(?P<desc>.*)')
@@ -80,31 +89,12 @@ stop_words = [
     'enum', 'fun', 'var', 'val', 'companion', 'object', 'class',
 ]
 
-def balance_braces(line, brace_count):
-    if line.startswith("//"): return brace_count
-    line = string_pattern.sub("", line)
-    line = comment_pattern.sub("", line)
-    line = line_comment_pattern.sub("", line)
-    open_braces = line.count('{')
-    close_braces = line.count('}')
-    braces = brace_count + open_braces - close_braces
-    return braces
-
 def balance_comment(line, comment_count):
     open_braces = line.count('/*')
     close_braces = line.count('*/')
     braces = comment_count + open_braces - close_braces
     return braces
 
-def balance_bracket(line):
-    if line.startswith("//"): return 0
-    line = string_pattern.sub("", line)
-    line = comment_pattern.sub("", line)
-    line = line_comment_pattern.sub("", line)
-    open_brackets = line.count('(')
-    close_brackets = line.count(')')
-    return open_brackets - close_brackets
-
 # fetch documentation block
 def get_doc_block(content, line):
 
@@ -177,76 +167,105 @@ def doc_line_to_rst(doc_line):
     if doc_line:
         return doc_line[0]
 
-def doc_block_to_rst(doc_block, is_class = False):
-    # sphinx requires a newline between documentation and directives
-    # but Kotlin does not
-    global was_doc
-    was_doc = True
-
-    def emit_doc():
-        global was_doc
-        if not was_doc:
-            was_doc = True
-            return True
-        return False
+class KotlinDocRenderer(object):
+    """
+    Converts documentation blocks to reStructuredText.
 
-    def emit_directive():
-        global was_doc
-        if was_doc:
-            was_doc = False
-            return True
-        return False
+    A conversion keeps its state to itself, so a renderer can be shared by
+    threads. Converted blocks are remembered by their content, as inherited
+    and repeated documentation is converted only once.
+    """
 
-    code_mode = False
+    cache_size = 4096
 
-    for l in doc_block:
-        l = l.strip()
-        if l and l[0] == '*':
-            l = l[1:]
+    def __init__(self):
+        self.cache = {}
 
-        if codeblock_pattern.match(l):
-            if not code_mode:
-                code_mode = True
-                yield '.. code-block:: kotlin'
-                yield ''
-                continue
-            else:
-                code_mode = False
-                continue
-        if code_mode:
-            yield '    ' + l
-            continue
+    def render(self, doc_block, is_class=False):
+        key = (tuple(doc_block), is_class)
+        lines = self.cache.get(key)
+        if lines is None:
+            lines = tuple(self.convert(doc_block, is_class))
+            if len(self.cache) >= self.cache_size:
+                self.cache.clear()
+            self.cache[key] = lines
+        return lines
 
-        match = param_pattern.match(l)
-        if match:
-            if is_class: # Skip parameters for class
+    @staticmethod
+    def convert(doc_block, is_class=False):
+        # sphinx requires a newline between documentation and directives
+        # but Kotlin does not
+        was_doc = True
+
+        def emit_doc():
+            nonlocal was_doc
+            if not was_doc:
+                was_doc = True
+                return True
+            return False
+
+        def emit_directive():
+            nonlocal was_doc
+            if was_doc:
+                was_doc = False
+                return True
+            return False
+
+        code_mode = False
+
+        for l in doc_block:
+            l = l.strip()
+            if l and l[0] == '*':
+                l = l[1:]
+
+            if codeblock_pattern.match(l):
+                if not code_mode:
+                    code_mode = True
+                    yield '.. code-block:: kotlin'
+                    yield ''
+                    continue
+                else:
+                    code_mode = False
+                    continue
+            if code_mode:
+                yield '    ' + l
                 continue
-            match = match.groupdict()
-            # if emit_directive(): yield ''
-            yield ':parameter ' + match['param'] + ': ' + match['desc']
-            continue
 
-        if '@property' in l:
-            continue
-
-        c = False #continue if required
-        for name,pattern in list(typical_patterns.items()):
-            match = pattern.match(l)
+            match = param_pattern.match(l)
             if match:
+                if is_class: # Skip parameters for class
+                    continue
                 match = match.groupdict()
                 # if emit_directive(): yield ''
-                yield ':' + name + ': ' + match['desc']
-                c = True
-                break
-        if c: continue
+                yield ':parameter ' + match['param'] + ': ' + match['desc']
+                continue
 
-        if not was_doc and l != "":
-            yield "    " + l
-            continue
+            if '@property' in l:
+                continue
 
-        #if we've got here, assume it's doc
-        if emit_doc(): yield ''
-        yield l.strip()
+            c = False #continue if required
+            for name,pattern in list(typical_patterns.items()):
+                match = pattern.match(l)
+                if match:
+                    match = match.groupdict()
+                    # if emit_directive(): yield ''
+                    yield ':' + name + ': ' + match['desc']
+                    c = True
+                    break
+            if c: continue
+
+            if not was_doc and l != "":
+                yield "    " + l
+                continue
+
+            #if we've got here, assume it's doc
+            if emit_doc(): yield ''
+            yield l.strip()
+
+doc_renderer = KotlinDocRenderer()
+
+def doc_block_to_rst(doc_block, is_class = False):
+    return doc_renderer.render(doc_block, is_class)
 
 def is_inside_comment(test_word, line):
     pos_comment_beg = line.find('/*')
@@ -327,29 +346,16 @@ def analyze_class_line(index, content):
 
     return out
 
-def fix_line_breaks(index, content):
-    l = content[index].rstrip()
-
-    counter = 0
-    while balance_bracket(l) != 0:
-        index += 1
-        counter += 1
-        if counter > 6:
-            break
-        if len(content) <= index:
-            break
-
-        l += ' ' + content[index].strip()
-
-    return l, index
-
-def prepare_enum_class(index, content):
+def prepare_enum_class(index, content, end=None):
     out = []
     brace_balance = 0
     comment_balance = 0
     end_enum_block = False
 
-    for i in range(index + 1, len(content)):
+    if end is None:
+        end = len(content) - 1
+
+    for i in range(index + 1, end + 1):
         strip_content = content[i].strip()
 
         comment_balance = balance_comment(strip_content, comment_balance)
@@ -372,97 +378,420 @@ def prepare_enum_class(index, content):
 
     return out
 
+def timed(timings, name, func, *args, **kwargs):
+    # call func and add its time and traced memory to timings[name]
+    if timings is None:
+        return func(*args, **kwargs)
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    entry = timings.setdefault(name, [0.0, 0])
+    entry[0] += time.perf_counter() - start
+    entry[1] += tracemalloc.get_traced_memory()[0] - before
+    return result
+
+def drop_raw(symbols):
+    # the source lines are not needed to write the documentation
+    for item in symbols:
+        item.pop('raw', None)
+        if 'members' in item:
+            for member in item['members'].index:
+                member.pop('raw', None)
+        drop_raw(item['children'])
+
+def map_file(file):
+    # read only mapping of the whole file, empty files can not be mapped
+    with io.open(file, mode="rb") as fp:
+        if os.fstat(fp.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+def release(data):
+    if isinstance(data, mmap.mmap):
+        data.close()
+
+def picklable(data):
+    # mapped files are mapped again by the worker process
+    if isinstance(data, mmap.mmap):
+        return None
+    return data
+
 class KotlinFileIndex(object):
 
     symbol_signatures = [class_sig(), enum_class_sig(), data_class_sig(), extension_sig(), interface_sig(), fun_sig()]
-
-    def __init__(self, search_path):
+    symbol_dispatch = {
+        'class': symbol_signatures[0],
+        'object': symbol_signatures[0],
+        'enum': symbol_signatures[1],
+        'data': symbol_signatures[2],
+        'extension': symbol_signatures[3],
+        'interface': symbol_signatures[4],
+        'fun': symbol_signatures[5],
+    }
+    symbol_type = KotlinSymbol
+    # print every file which is parsed
+    verbose = True
+    # files of this size or larger are memory mapped and their lines are
+    # decoded when they are read, None reads every file as a whole
+    mmap_threshold = 32 * 1024 * 1024
+    # lines searched upwards for the documentation of a mapped file
+    doc_lookback = 1000
+
+    @classmethod
+    def parse_settings(cls):
+        """Settings the parsed symbols depend on."""
+        return cls.mmap_threshold, cls.doc_lookback
+
+    @classmethod
+    def settings(cls):
+        """Class settings changed by the command line."""
+        return {'verbose': cls.verbose, 'mmap_threshold': cls.mmap_threshold, 'doc_lookback': cls.doc_lookback}
+
+    @classmethod
+    def configure(cls, settings):
+        for name, value in settings.items():
+            setattr(cls, name, value)
+
+    @classmethod
+    def executor(cls, jobs):
+        # spawned and forkserver workers import the class again, they get
+        # the settings of this process when they start
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs, initializer=cls.configure, initargs=(cls.settings(),))
+
+    def __init__(self, search_path, cache=None, jobs=1, files=None, keep_raw=True, profile=None):
         self.index = []
+        self.keep_raw = keep_raw
 
         # find all files
-        self.files = []
-        for path in search_path:
-            for root, dirnames, filenames in os.walk(path):
-                for filename in fnmatch.filter(filenames, '*.kt'):
-                    self.files.append(os.path.join(root, filename))
+        if files is None:
+            files = self.find_files(search_path)
+        self.files = list(files)
 
+        if jobs == 0:
+            jobs = os.cpu_count() or 1
+
+        if jobs > 1:
+            self.index_parallel(cache, jobs, profile)
+        else:
+            for file in self.files:
+                self.index.extend(self.index_file(file, cache, profile))
+
+        if not keep_raw:
+            drop_raw(self.index)
+
+    @staticmethod
+    def find_files(search_path, finder=None):
+        if finder is None:
+            finder = KotlinSourceFinder()
+        return finder.find(search_path)
+
+    def update_files(self, changed, removed=(), cache=None):
+        """
+        Parse the changed files again and forget the removed ones, returns
+        the new symbols of every changed file.
+        """
+        dropped = set(changed) | set(removed)
+        self.index = [item for item in self.index if item['file'] not in dropped]
+        self.files = [file for file in self.files if file not in dropped] + list(changed)
+
+        symbols = {}
+        for file in changed:
+            symbols[file] = self.index_file(file, cache)
+            if not self.keep_raw:
+                drop_raw(symbols[file])
+            self.index.extend(symbols[file])
+        return symbols
+
+    def index_parallel(self, cache, jobs, profile=None):
+        symbols = {}
+        pending = []
         for file in self.files:
+            data, cached = self.read_file(file, cache, profile)
+            if cached is not None:
+                symbols[file] = cached
+                release(data)
+                continue
+            pending.append((file, data))
+
+        # hand out the largest files first to keep all workers busy
+        pending.sort(key=lambda item: len(item[1]), reverse=True)
+
+        with self.executor(jobs) as executor:
+            futures = []
+            for file, data in pending:
+                futures.append(executor.submit(self.parser(profile), file, picklable(data)))
+
+            for (file, data), future in zip(pending, futures):
+                symbols[file] = self.parsed(file, future.result(), profile)
+                self.store_file(file, data, symbols[file], cache, profile)
+                release(data)
+
+        # merge in the discovery order, same as the serial mode
+        for file in self.files:
+            self.index.extend(symbols[file])
+
+    @classmethod
+    def iter_files(cls, files, cache=None, jobs=1, keep_raw=True, profile=None):
+        """
+        Parse the files one by one and yield (file, symbols) in the order of
+        files. With several jobs at most two files per job are parsed ahead,
+        so only a bounded part of the tree is kept in memory.
+        """
+        for file, symbols in cls.iter_parsed(files, cache, jobs, profile):
+            if not keep_raw:
+                drop_raw(symbols)
+            yield file, symbols
+
+    @classmethod
+    def iter_parsed(cls, files, cache, jobs, profile):
+        if jobs == 0:
+            jobs = os.cpu_count() or 1
+
+        if jobs <= 1:
+            for file in files:
+                yield file, cls.index_file(file, cache, profile)
+            return
+
+        with cls.executor(jobs) as executor:
+            pending = collections.deque()
+            for file in files:
+                pending.append(cls.submit_file(executor, file, cache, profile))
+                if len(pending) >= jobs * 2:
+                    yield cls.collect_file(pending.popleft(), cache, profile)
+            while pending:
+                yield cls.collect_file(pending.popleft(), cache, profile)
+
+    @classmethod
+    def submit_file(cls, executor, file, cache, profile=None):
+        data, symbols = cls.read_file(file, cache, profile)
+        if symbols is not None:
+            release(data)
+            return file, None, symbols, None
+        return file, data, None, executor.submit(cls.parser(profile), file, picklable(data))
+
+    @classmethod
+    def collect_file(cls, task, cache, profile=None):
+        file, data, symbols, future = task
+        if future is not None:
+            symbols = cls.parsed(file, future.result(), profile)
+            cls.store_file(file, data, symbols, cache, profile)
+            release(data)
+        return file, symbols
+
+    @classmethod
+    def index_file(cls, file, cache=None, profile=None):
+        data, symbols = cls.read_file(file, cache, profile)
+        if symbols is None:
+            symbols = cls.parsed(file, cls.parser(profile)(file, data), profile)
+            cls.store_file(file, data, symbols, cache, profile)
+        release(data)
+        return symbols
+
+    @classmethod
+    def read_file(cls, file, cache=None, profile=None):
+        """
+        Read the file, returns its data and the cached symbols or None.
+        Large files are memory mapped, release the data when done with it.
+        """
+        start = time.perf_counter()
+        if cls.mmap_threshold is not None and os.path.getsize(file) >= cls.mmap_threshold:
+            data = map_file(file)
+        else:
+            with io.open(file, mode="rb") as fp:
+                data = fp.read()
+        if profile is not None:
+            profile.add('read', time.perf_counter() - start, file=file)
+
+        symbols = None
+        if cache is not None:
+            start = time.perf_counter()
+            symbols = cache.load(file, data)
+            if profile is not None:
+                profile.add('cache', time.perf_counter() - start, file=file)
+
+        if symbols is None and cls.verbose:
             print(("Indexing kotlin file: %s" % file))
-            symbol_stack = []
-            braces = 0
-            with io.open(file, mode="r", encoding="utf-8") as fp:
-                content = fp.readlines()
-                for (index, line) in enumerate(content):
-                    braces = balance_braces(line, braces)
-
-                    # track boxed context
-                    for pattern in self.symbol_signatures:
-                        match = pattern.match(line)
-                        if match:
-                            match = match.groupdict()
-
-                            struct = match['struct'].strip()
-                            scope = 'public'
-                            if 'scope' in match and match['scope']:
-                                scope = match['scope'].strip()
-
-                            if scope == 'open' or scope == 'external':
-                                scope = 'public'
-
-                            typeVal = clear_name(struct)
-
-                            item = {
-                                'file': file,
-                                'line': index,
-                                'depth': 1 if braces == 0 else braces,
-                                'type': typeVal,
-                                'scope': scope,
-                                'name': match['name'].strip() + match['rest'] if match['rest'] and typeVal == 'fun' else match['name'].strip(),
-                                'docstring': get_doc_block(content, index - 1),
-                                'param': match['type'].strip() if match['type'] else None,
-                                'children': [],
-                                'raw': line
-                            }
-
-                            if typeVal == 'fun':
-                                if braces == 0 or (braces == 1 and line.find('}') == -1 and line.find('{') != -1):
-                                    symbol_stack.append(item)
-                                continue
-
-                            if len(symbol_stack) > 0 and braces > symbol_stack[-1]['depth']:
-                                symbol_stack[-1]['children'].append(item)
-                            else:
-                                symbol_stack.append(item)
-
-
-                            item_details = analyze_class_line(index, content)
-                            # print item['name']
-                            # print item_details
-                            if item_details['no_body']:
-                                if item_details['constructor']:
-                                    contentPlus = []
-                                    contentPlus.append('/**')
-                                    contentPlus.extend(item['docstring'])
-                                    contentPlus.append('*/')
-                                    contentPlus.append('firstconstructor' + item_details['constructor'])
-                                    contentPlus.append('')
-                                    item['members'] = KotlinObjectIndex(contentPlus, 0, item['type'])
-                            else:
-                                if item['type'] == 'enum_class':
-                                    enum_item = prepare_enum_class(index, content)
-                                    item['members'] = KotlinObjectIndex(enum_item, 0, item['type'])
-                                elif item_details['constructor']:
-                                    contentPlus = []
-                                    contentPlus.append('/**')
-                                    contentPlus.extend(item['docstring'])
-                                    contentPlus.append('*/')
-                                    contentPlus.append('firstconstructor' + item_details['constructor'])
-                                    contentPlus.extend(content[item_details['start'] + 1:])
-                                    item['members'] = KotlinObjectIndex(contentPlus, 0, item['type'])
-                                else:
-                                    item['members'] = KotlinObjectIndex(content, item_details['start'] + 1, item['type'])
+        return data, symbols
+
+    @staticmethod
+    def store_file(file, data, symbols, cache, profile=None):
+        if cache is None:
+            return
+        start = time.perf_counter()
+        cache.store(file, data, symbols)
+        if profile is not None:
+            profile.add('cache', time.perf_counter() - start, file=file)
+
+    @classmethod
+    def parser(cls, profile):
+        # the timed parser also runs in the worker processes
+        if profile is None:
+            return cls.parse_data
+        return cls.parse_timed
+
+    @staticmethod
+    def parsed(file, result, profile):
+        if profile is None:
+            return result
+        symbols, timings, peak = result
+        profile.add_timings(file, timings, peak)
+        return symbols
+
+    @staticmethod
+    def decode(data):
+        return io.StringIO(data.decode("utf-8"), newline=None).readlines()
+
+    @staticmethod
+    def is_mapped(data):
+        # None is a mapped file handed to a worker process
+        return data is None or isinstance(data, mmap.mmap)
+
+    @classmethod
+    def parse_data(cls, file, data):
+        if cls.is_mapped(data):
+            return cls.parse_mapped(file, data)
+        return cls.parse(file, cls.decode(data))
+
+    @classmethod
+    def parse_mapped(cls, file, data=None, timings=None):
+        """
+        Parse the file without decoding it as a whole: the lines are decoded
+        when they are read and the documentation is searched in a bounded
+        number of lines, so the memory use does not grow with the file.
+        """
+        if data is None:
+            data = map_file(file)
+            try:
+                return cls.parse_mapped(file, data, timings)
+            finally:
+                release(data)
+
+        content = timed(timings, 'lines', KotlinLines, data)
+        source = timed(timings, 'scan', scan, content, data, cls.doc_lookback)
+        return cls.parse(file, content, timings, source)
+
+    @classmethod
+    def parse_timed(cls, file, data):
+        """
+        Same as parse_data, but also returns the time and the traced memory
+        of the parsing steps and the traced memory peak.
+        """
+        timings = {}
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+
+        if cls.is_mapped(data):
+            symbols = cls.parse_mapped(file, data, timings)
+        else:
+            content = timed(timings, 'decode', cls.decode, data)
+            symbols = cls.parse(file, content, timings)
+
+        # the rest is the matching of the declarations line by line
+        seconds = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        timings['declarations'] = [
+            seconds - sum(entry[0] for entry in timings.values()),
+            current - before - sum(entry[1] for entry in timings.values()),
+        ]
+        return symbols, timings, peak - before if tracing else None
+
+    @classmethod
+    def match_declaration(cls, line):
+        # a single cheap pattern selects the only signature that can match
+        match = declaration_pattern.match(line)
+        if not match:
+            return None
+        return cls.symbol_dispatch[match.group('keyword')].match(line)
+
+    @classmethod
+    def parse(cls, file, content, timings=None, source=None):
+        if source is None:
+            source = timed(timings, 'scan', scan, content)
+        symbol_stack = []
+        # symbols with a body which is still open, innermost last
+        open_symbols = []
+        for (index, line) in enumerate(content):
+            match = cls.match_declaration(line)
+            if not match:
+                continue
+
+            braces = source.depth[index]
+            match = match.groupdict()
+
+            struct = match['struct'].strip()
+            scope = 'public'
+            if 'scope' in match and match['scope']:
+                scope = match['scope'].strip()
+
+            if scope == 'open' or scope == 'external':
+                scope = 'public'
+
+            typeVal = clear_name(struct)
+
+            item = cls.symbol_type(
+                file=file,
+                line=index,
+                depth=1 if braces == 0 else braces,
+                type=typeVal,
+                scope=scope,
+                name=match['name'].strip() + match['rest'] if match['rest'] and typeVal == 'fun' else match['name'].strip(),
+                docstring=source.docs.doc_block(index - 1),
+                param=match['type'].strip() if match['type'] else None,
+                children=[],
+                raw=line
+            )
+
+            level = source.depth_before(index) + 1
+            while open_symbols and open_symbols[-1][1] < index:
+                open_symbols.pop()
+
+            if typeVal == 'fun':
+                # only top level functions, members are indexed by their class
+                if level == 1:
+                    symbol_stack.append(item)
+                    l, last = source.logical_line(index)
+                    end = source.block_end(index, last, level)
+                    if end is not None:
+                        open_symbols.append((item, end))
+                continue
+
+            if open_symbols:
+                open_symbols[-1][0]['children'].append(item)
+            else:
+                symbol_stack.append(item)
+
+            item_details = timed(timings, 'analyze_class_line', analyze_class_line, index, content)
+            # print item['name']
+            # print item_details
+            if item_details['no_body']:
+                if item_details['constructor']:
+                    item['members'] = timed(
+                        timings, 'members', KotlinObjectIndex,
+                        content, index + 1, item['type'], source, end=index,
+                        constructor=item_details['constructor'],
+                        docstring=item['docstring'])
+                continue
+
+            end = source.block_end(index, item_details['start'], level)
+            if end is None:
+                end = len(content) - 1
+            open_symbols.append((item, end))
+
+            if item['type'] == 'enum_class':
+                enum_item = timed(timings, 'members', prepare_enum_class, index, content, end)
+                item['members'] = timed(timings, 'members', KotlinObjectIndex, enum_item, 0, item['type'])
+            else:
+                item['members'] = timed(
+                    timings, 'members', KotlinObjectIndex,
+                    content, item_details['start'] + 1, item['type'], source, end=end,
+                    constructor=item_details['constructor'],
+                    docstring=item['docstring'])
 
-            self.index.extend(symbol_stack)
+        return symbol_stack
 
     def by_file(self, index=None):
         result = {}
@@ -487,7 +816,8 @@ class KotlinFileIndex(object):
         yield line
 
         if noindex:
-            yield indent + ':noindex:'
+            # an option of the directive, the caller indents the block
+            yield '   :noindex:'
         yield ''
 
         if not nodocstring:
@@ -497,173 +827,221 @@ class KotlinFileIndex(object):
 
 class KotlinObjectIndex(object):
 
-    def __init__(self, content, line, typ):
+    member_type = KotlinMember
+
+    def __init__(self, content, line, typ, source=None, end=None, constructor=None, docstring=None):
         signatures = [func_pattern, init_pattern, var_pattern]
         if typ == 'enum_class':
             signatures = [case_pattern]
         # elif typ == 'protocol':
         #     signatures = [func_pattern, init_pattern, proto_var_pattern]
 
+        if source is None:
+            source = scan(content)
+        if end is None:
+            end = len(content) - 1
+
         self.index = []
         braces = 1
         static_braces = 0
+        # brace depth of the source outside of the object body
+        base = source.depth_before(line) - 1
+
+        # primary constructor is indexed as a virtual first line of the body,
+        # documented by the class documentation block
+        if constructor:
+            if docstring is None:
+                docstring = []
+            docs = KotlinDocIndex(['/**'] + docstring + ['*/'])
+            self.add_line('firstconstructor' + constructor, line - 1, typ, signatures, False,
+                          lambda: docs.doc_block(len(docstring) + 1))
 
         # Make full string from fun begin to the closed brace
         i = line
-        while i < len(content):
-            l, new_i = fix_line_breaks(i, content)
-            counter = new_i - i
+        while i <= end:
+            l, new_i = source.logical_line(i)
+            first = i
             i = new_i + 1
 
             # balance braces
             old_braces = braces
-            braces = balance_braces(l, braces)
-            if 'companion object' in clear_name(l, ' '):
+            braces = source.depth[new_i] - base
+            companion = 'companion object' in clear_name(l, ' ')
+            if companion:
                 static_braces = braces
             if braces < static_braces:
                 static_braces = 0
 
             if braces <= 0:
                 break
+
+            # bodies of members and nested declarations are not members of
+            # this object, nested declarations have their own index
+            block_end = None
+            if braces > old_braces and not companion:
+                block_end = source.block_end(first, new_i, old_braces + base + 1)
+
+            if block_end is not None and block_end > new_i:
+                next_line = block_end
+                next_braces = source.depth_before(block_end) - base
+            else:
+                next_line = i
+                next_braces = braces
+
             if braces > 1 and old_braces == braces:
                 continue
 
-            for pattern in signatures:
-                match = pattern.match(l)
-                if match:
-                    match = match.groupdict()
-                    scope = 'public'
-                    if 'scope' in match and match['scope']:
-                        scope = match['scope'].strip()
+            static = static_braces > 0 and static_braces <= braces
+            self.add_line(l, new_i, typ, signatures, static,
+                          lambda: source.docs.doc_block(first - 1))
 
-                    if scope == 'open' or scope == 'external':
-                        scope = 'public'
+            i = next_line
+            braces = next_braces
+
+    @classmethod
+    def from_members(cls, members):
+        """Index of members which were already parsed, like the ones of a snapshot."""
+        index = cls.__new__(cls)
+        index.index = list(members)
+        return index
+
+    def add_line(self, l, line, typ, signatures, static, get_docstring):
+        for pattern in signatures:
+            match = pattern.match(l)
+            if match:
+                match = match.groupdict()
+                scope = 'public'
+                if 'scope' in match and match['scope']:
+                    scope = match['scope'].strip()
+
+                if scope == 'open' or scope == 'external':
+                    scope = 'public'
 
-                    doc_block_pos = l.find('/**<')
-                    if doc_block_pos != -1:
-                        doc_block_end = l.find('*/')
+                doc_block_pos = l.find('/**<')
+                if doc_block_pos != -1:
+                    doc_block_end = l.find('*/')
+                    docstring = []
+                    docstring.append(l[doc_block_pos + 4:doc_block_end].strip())
+                else:
+                    if typ != 'enum_class':
+                        docstring = get_docstring()
+                    else:
                         docstring = []
-                        docstring.append(l[doc_block_pos + 4:doc_block_end].strip())
+                if "@suppress" in docstring:
+                    continue
+
+                typeVal = ''
+                if 'type' in match and match['type']:
+                    if static:
+                        typeVal = 'static_' + match['type'].strip()
                     else:
-                        if typ != 'enum_class':
-                            docstring = get_doc_block(content, i - counter - 2)
-                        else:
-                            docstring = []
-                    if "@suppress" in docstring:
-                        continue
-
-                    typeVal = ''
-                    if 'type' in match and match['type']:
-                        if static_braces > 0 and static_braces <= braces:
-                            typeVal = 'static_' + match['type'].strip()
-                        else:
-                            typeVal = match['type'].strip()
-
-                    if typ == 'enum_class':
-                        typeVal = 'enum_case'
-
-                    nameVal = ''
-                    constructorVariables = []
-                    if 'name' in match and match['name']:
-                        nameVal = match['name'].strip()
-                    if typeVal == 'init':
-                        nameVal = 'init'
-                    elif typeVal == 'constructor':
-                        nameVal = 'constructor'
-                        if 'rest' in match and match['rest']:
-                            splitPos = match['rest'].find(')') + 1
-                            if splitPos != 0:
-                                match['rest'] = match['rest'][:splitPos]
-                    elif typeVal == 'firstconstructor':
-                        nameVal = 'constructor'
-                        typeVal = 'constructor'
-
-                        docstring_new = ['Main constructor', '']
-                        if 'rest' in match and match['rest']:
-                            variables = match['rest'].strip()[1:-1].split(',')
-                            firstVal = True
-                            match['rest'] = '('
-                            for variable in variables:
-                                vmatch = var_pattern.match(variable)
-                                if vmatch:
-                                    vmatch = vmatch.groupdict()
+                        typeVal = match['type'].strip()
+
+                if typ == 'enum_class':
+                    typeVal = 'enum_case'
+
+                nameVal = ''
+                constructorVariables = []
+                if 'name' in match and match['name']:
+                    nameVal = match['name'].strip()
+                if typeVal == 'init':
+                    nameVal = 'init'
+                elif typeVal == 'constructor':
+                    nameVal = 'constructor'
+                    if 'rest' in match and match['rest']:
+                        splitPos = match['rest'].find(')') + 1
+                        if splitPos != 0:
+                            match['rest'] = match['rest'][:splitPos]
+                elif typeVal == 'firstconstructor':
+                    nameVal = 'constructor'
+                    typeVal = 'constructor'
+
+                    docstring_new = ['Main constructor', '']
+                    if 'rest' in match and match['rest']:
+                        variables = match['rest'].strip()[1:-1].split(',')
+                        firstVal = True
+                        match['rest'] = '('
+                        for variable in variables:
+                            vmatch = var_pattern.match(variable)
+                            if vmatch:
+                                vmatch = vmatch.groupdict()
+                                vscope = 'public'
+                                if 'scope' in vmatch and vmatch['scope']:
+                                    vscope = vmatch['scope'].strip()
+
+                                if vscope == 'open' or vscope == 'external':
                                     vscope = 'public'
-                                    if 'scope' in vmatch and vmatch['scope']:
-                                        vscope = vmatch['scope'].strip()
-
-                                    if vscope == 'open' or vscope == 'external':
-                                        vscope = 'public'
-
-                                    # In constructor all inputs should listed
-                                    # if vscope != 'public':
-                                    #     continue
-
-                                    vnameVal = vmatch['name'].strip() if 'name' in vmatch and vmatch['name'] else None
-                                    vtypeVal = vmatch['type'].strip() if 'type' in vmatch and vmatch['type'] else None
-                                    vrestVal = vmatch['rest'].strip() if 'rest' in vmatch and vmatch['rest'] else None
-                                    constructorVariables.append({
-                                        'scope': vscope,
-                                        'line': i,
-                                        'type': vtypeVal,
-                                        'name': vnameVal,
-                                        'docstring': get_docstring_for_val(vnameVal, docstring),
-                                        'rest': vrestVal,
-                                        'raw': variable
-                                    })
-
-                                    if firstVal:
-                                        firstVal = False
-                                        if vrestVal:
-                                            match['rest'] += vnameVal + vrestVal
-                                        else:
-                                            match['rest'] += vnameVal
+
+                                # In constructor all inputs should listed
+                                # if vscope != 'public':
+                                #     continue
+
+                                vnameVal = vmatch['name'].strip() if 'name' in vmatch and vmatch['name'] else None
+                                vtypeVal = vmatch['type'].strip() if 'type' in vmatch and vmatch['type'] else None
+                                vrestVal = vmatch['rest'].strip() if 'rest' in vmatch and vmatch['rest'] else None
+                                constructorVariables.append(self.member_type(
+                                    scope=vscope,
+                                    line=line + 1,
+                                    type=vtypeVal,
+                                    name=vnameVal,
+                                    docstring=get_docstring_for_val(vnameVal, docstring),
+                                    rest=vrestVal,
+                                    raw=variable
+                                ))
+
+                                if firstVal:
+                                    firstVal = False
+                                    if vrestVal:
+                                        match['rest'] += vnameVal + vrestVal
                                     else:
-                                        if vrestVal:
-                                            match['rest'] += ', ' + vnameVal + vrestVal
-                                        else:
-                                            match['rest'] += ', ' + vnameVal
+                                        match['rest'] += vnameVal
                                 else:
+                                    if vrestVal:
+                                        match['rest'] += ', ' + vnameVal + vrestVal
+                                    else:
+                                        match['rest'] += ', ' + vnameVal
+                            else:
 
-                                    strip_variable = variable.replace(':', '|').replace('=', '|').split('|')
-                                    # print(strip_variable)
-                                    param_docstring = get_docstring_for_param(strip_variable[0], docstring)
+                                strip_variable = variable.replace(':', '|').replace('=', '|').split('|')
+                                # print(strip_variable)
+                                param_docstring = get_docstring_for_param(strip_variable[0], docstring)
 
-                                    if firstVal:
-                                        firstVal = False
-                                        if len(strip_variable) > 1 and strip_variable[1]:
-                                            match['rest'] += strip_variable[0] + strip_variable[1]
-                                        else:
-                                            match['rest'] += strip_variable[0]
+                                if firstVal:
+                                    firstVal = False
+                                    if len(strip_variable) > 1 and strip_variable[1]:
+                                        match['rest'] += strip_variable[0] + strip_variable[1]
                                     else:
-                                        if len(strip_variable) > 1 and strip_variable[1]:
-                                            match['rest'] += ', ' + strip_variable[0] + strip_variable[1]
-                                        else:
-                                            match['rest'] += ', ' + strip_variable[0]
-
-                                    if param_docstring:
-                                        docstring_new.append('@param ' + strip_variable[0] + ' ' + ''.join(param_docstring))
-
-                            match['rest'] += ')'
-                        for constructorVariable in constructorVariables:
-                            if constructorVariable['docstring']:
-                                docstring_new.append('@param ' + constructorVariable['name'] + ' ' + ''.join(constructorVariable['docstring']))
-
-                        docstring = docstring_new
-                    # print 'Match ' + l + '[{},{},{}]'.format(nameVal, typeVal,scope)
-
-                    self.index.append({
-                        'scope': scope,
-                        'line': i - 1,
-                        'type': typeVal,
-                        'name': nameVal,
-                        'docstring': docstring,
-                        'rest': match['rest'].strip() if 'rest' in match and match['rest'] else None,
-                        'raw_value': match['raw_value'].strip() if 'raw_value' in match and match['raw_value'] else None,
-                        'raw': l
-                    })
-
-                    if constructorVariables:
-                        self.index.extend(constructorVariables)
+                                        match['rest'] += strip_variable[0]
+                                else:
+                                    if len(strip_variable) > 1 and strip_variable[1]:
+                                        match['rest'] += ', ' + strip_variable[0] + strip_variable[1]
+                                    else:
+                                        match['rest'] += ', ' + strip_variable[0]
+
+                                if param_docstring:
+                                    docstring_new.append('@param ' + strip_variable[0] + ' ' + ''.join(param_docstring))
+
+                        match['rest'] += ')'
+                    for constructorVariable in constructorVariables:
+                        if constructorVariable['docstring']:
+                            docstring_new.append('@param ' + constructorVariable['name'] + ' ' + ''.join(constructorVariable['docstring']))
+
+                    docstring = docstring_new
+                # print 'Match ' + l + '[{},{},{}]'.format(nameVal, typeVal,scope)
+
+                self.index.append(self.member_type(
+                    scope=scope,
+                    line=line,
+                    type=typeVal,
+                    name=nameVal,
+                    docstring=docstring,
+                    rest=match['rest'].strip() if 'rest' in match and match['rest'] else None,
+                    raw_value=match['raw_value'].strip() if 'raw_value' in match and match['raw_value'] else None,
+                    raw=l
+                ))
+
+                if constructorVariables:
+                    self.index.extend(constructorVariables)
 
     @staticmethod
     def documentation(item, indent="    ", noindex=False, nodocstring=False, location=None):
@@ -706,7 +1084,8 @@ class KotlinObjectIndex(object):
                 yield '.. kotlin:fun:: ' + sig
 
         if noindex:
-            yield indent + ':noindex:'
+            # an option of the directive, in the column of its docstring
+            yield indent + ' :noindex:'
         yield ''
 
         if not nodocstring and item['type'] != 'enum_case':
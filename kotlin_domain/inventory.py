@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  Kotlin objects of other projects read from their inventories
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import io
+import re
+import zlib
+
+# same line format as written by sphinx, names may contain spaces
+entry_pattern = re.compile(r'(.+?)\s+(\S+)\s+(-?\d+)\s+?(\S*)\s+(.*)')
+
+
+def read_inventory(filename, base_url, domain='kotlin'):
+    """
+    Read the objects of the domain from a version 2 objects.inv file.
+
+    Returns a list of (name, objtype, url, dispname) tuples, the urls are
+    joined with base_url.
+    """
+    with io.open(filename, mode='rb') as fp:
+        header = fp.readline().rstrip()
+        if header != b'# Sphinx inventory version 2':
+            raise ValueError('unsupported inventory format: {}'.format(header.decode('utf-8', 'replace')))
+        fp.readline() # project
+        fp.readline() # version
+        if b'zlib' not in fp.readline():
+            raise ValueError('inventory is not compressed using zlib')
+        content = zlib.decompress(fp.read()).decode('utf-8')
+
+    if base_url and not base_url.endswith('/'):
+        base_url += '/'
+
+    prefix = domain + ':'
+    objects = []
+    for line in content.splitlines():
+        match = entry_pattern.match(line.rstrip())
+        if not match:
+            continue
+        name, typ, prio, location, dispname = match.groups()
+        if not typ.startswith(prefix):
+            continue
+        if location.endswith('$'):
+            location = location[:-1] + name
+        if dispname == '-':
+            dispname = name
+        objects.append((name, typ[len(prefix):], base_url + location, dispname))
+    return objects
+
+
+class KotlinInventory(object):
+    """
+    Lookup of the Kotlin objects documented by other projects.
+
+    Class-like objects are indexed by their bare name the same way the
+    domain indexes its own names, everything else by the full name.
+    """
+
+    def __init__(self, class_types):
+        self.class_types = class_types
+        self.names = {}
+
+    def add(self, objects):
+        for name, objtype, url, dispname in objects:
+            if objtype in self.class_types and name.startswith(objtype + ' '):
+                name = name[len(objtype) + 1:]
+            # the first inventory wins, like the local objects do
+            self.names.setdefault(name, (objtype, url, dispname))
+
+    def get(self, name):
+        return self.names.get(name)
@@ -42,6 +42,8 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import bisect
+import os
 import re
 
 from docutils import nodes
@@ -54,24 +56,14 @@ from sphinx.domains import Domain, ObjType, Index
 from sphinx.directives import ObjectDescription
 from sphinx.util.nodes import make_refnode
 from sphinx.util.docfields import Field, GroupedField, TypedField
+from sphinx.util import logging
 
-kotlin_reserved = set(['Double', 'Float', 'Long', 'Int', 'Short', 'Byte', 'Char',
-    'Boolean', 'ByteArray', 'ShortArray', 'IntArray',
-    'UByte', 'UShort', 'UInt', 'ULong',
-    'UByteArray', 'UShortArray', 'UIntArray', 'ULongArray', 'UIntProgression',
-    'UIntRange', 'ULongRange', 'ULongProgression', 'String',
-])
-
-def formExternalUrl(type):
-# https://kotlinlang.org/api/latest/jvm/stdlib/kotlin/-u-int/index.html
-# https://kotlinlang.org/api/latest/jvm/stdlib/kotlin/-double/index.html
-    out = 'https://kotlinlang.org/api/latest/jvm/stdlib/kotlin/'
-    for char in type:
-        if char.isupper():
-            out += '-' + char.lower()
-        else:
-            out += char
-    return out + '/index.html'
+from . import __version__
+from .stdlib import stdlib_urls
+from .inventory import KotlinInventory, read_inventory
+from .autodoc import KotlinAutoFile, KotlinAutoClass, merge_sources, prune_sources
+
+logger = logging.getLogger(__name__)
 
 def _iteritems(d):
     for k in d:
@@ -98,7 +90,7 @@ class KotlinObjectDescription(ObjectDescription):
         if fullname not in self.state.document.ids:
             signode['ids'].append(signature)
             self.state.document.note_explicit_target(signode)
-            self.env.domaindata['kotlin']['objects'][fullname] = (self.env.docname, self.objtype, signature)
+            self.env.get_domain('kotlin').note_object(fullname, self.objtype, signature)
         else:
             objects = self.env.domaindata['kotlin']['objects']
             self.warn('duplicate object description of %s, ' % fullname +
@@ -164,20 +156,34 @@ class KotlinClass(KotlinObjectDescription):
             class_name = container_class_name + '.' + class_name
         return self.objtype + ' ' + class_name, self.objtype + ' ' + class_name, add_to_index
 
+    clsname_set = False
+
     def before_content(self):
+        # temp_data belongs to the document being read, so the stack of
+        # enclosing classes is separate in every parallel reader
         if self.names:
             parts = self.names[0][1].split(" ")
             if len(parts) > 1:
-                self.env.temp_data['kotlin:class'] = " ".join(parts[1:])
+                class_name = " ".join(parts[1:])
             else:
-                env.temp_data['kotlin:class'] = self.names[0][1]
+                class_name = self.names[0][1]
+            classes = self.env.temp_data.setdefault('kotlin:classes', [])
+            classes.append((class_name, self.objtype))
+            self.env.temp_data['kotlin:class'] = class_name
             self.env.temp_data['kotlin:class_type'] = self.objtype
             self.clsname_set = True
 
     def after_content(self):
         if self.clsname_set:
-            self.env.temp_data['kotlin:class'] = None
-            self.env.temp_data['kotlin:class_type'] = None
+            classes = self.env.temp_data.get('kotlin:classes', [])
+            if classes:
+                classes.pop()
+            if classes:
+                class_name, class_type = classes[-1]
+            else:
+                class_name, class_type = None, None
+            self.env.temp_data['kotlin:class'] = class_name
+            self.env.temp_data['kotlin:class_type'] = class_type
 
 
 class KotlinClassmember(KotlinObjectDescription):
@@ -477,11 +483,18 @@ type_order = ['class', 'data_class', 'enum_class', 'interface', 'extension']
 class KotlinModuleIndex(Index):
     """
     Index subclass to provide the Kotlin module index.
+
+    The entries are kept bucketed and sorted by the domain as objects are
+    noted and forgotten, the index only picks the buckets and caches them
+    until the objects change. Subclasses with a prefix list only the
+    objects of documents below it.
     """
 
     name = 'modindex'
     localname = _('Kotlin Module Index')
     shortname = _('Index')
+    # docname prefix of the objects of a package index
+    prefix = None
 
     @staticmethod
     def indexsorter(a):
@@ -502,48 +515,47 @@ class KotlinModuleIndex(Index):
                 break
         return a[3][start]
 
+    @staticmethod
+    def make_entry(refname, docname, typ, signature):
+        return (refname, 0, docname, signature, typ.replace("_", " "), '', '')
+
+    def includes(self, docname, docnames):
+        if docnames is not None and docname not in docnames:
+            return False
+        if self.prefix is None:
+            return True
+        return docname == self.prefix or docname.startswith(self.prefix.rstrip('/') + '/')
+
     def generate(self, docnames=None):
-        global type_order
-        content = []
-        collapse = 0
-
-        entries = []
-        for refname, (docname, typ, signature) in _iteritems(self.domain.data['objects']):
-            info = typ.replace("_", " ")
-            entries.append((
-                refname,
-                0,
-                docname,
-                signature,
-                info,
-                '',
-                ''
-            ))
-
-        entries = sorted(entries, key=self.sigsorter)
-        current_list = []
-        current_key = None
-        for entry in entries:
-            start = 0
-            for t in type_order:
-                if entry[3].startswith(t):
-                    start = len(t) + 1
-                    break
-
-            if entry[3][start].upper() != current_key:
-                if len(current_list) > 0:
-                    content.append((current_key, current_list))
-                current_key = entry[3][start].upper()
-                current_list = []
-            current_list.append(entry)
-        content.append((current_key, current_list))
+        cache = self.domain.index_cache()
+        key = (self.name, None if docnames is None else frozenset(docnames))
+        if key in cache:
+            return cache[key]
 
         result = []
-        for key, entries in content:
-            e = sorted(entries, key=self.indexsorter)
-            result.append((key, e))
+        buckets = self.domain.data['index']
+        for letter in sorted(buckets):
+            entries = [entry for sortkey, entry in buckets[letter] if self.includes(entry[2], docnames)]
+            if entries:
+                result.append((letter, entries))
+
+        cache[key] = (result, 0)
+        return cache[key]
+
+
+def package_index(name, prefix):
+    """Module index of the objects documented below the docname prefix."""
+    return type('KotlinPackageIndex', (KotlinModuleIndex,), {
+        'name': 'modindex-' + re.sub(r'[^A-Za-z0-9_-]', '-', name),
+        'localname': _('Kotlin Module Index') + ': ' + name,
+        'shortname': name,
+        'prefix': prefix,
+    })
 
-        return result, collapse
+
+def add_package_indices(app, config):
+    for name, prefix in sorted(config.kotlin_package_indices.items()):
+        app.add_index_to_domain('kotlin', package_index(name, prefix))
 
 
 class KotlinDomain(Domain):
@@ -586,6 +598,8 @@ class KotlinDomain(Domain):
         'default_impl':    KotlinClass,
         'val':             KotlinClassIvar,
         'var':             KotlinClassIvar,
+        'autofile':        KotlinAutoFile,
+        'autoclass':       KotlinAutoClass,
     }
 
     roles = {
@@ -608,15 +622,131 @@ class KotlinDomain(Domain):
     }
     initial_data = {
         'objects': {},  # fullname -> docname, objtype
+        'names': {},  # name -> [(objtype, docname, anchor), ...] for type_order objects
+        'docs': {},  # docname -> set of fullnames
+        'index': {},  # letter -> sorted [(sort key, module index entry), ...]
+        'duplicates': {},  # fullname -> {docname: (objtype, anchor)} not in objects
     }
+    data_version = 4
     indices = [
         KotlinModuleIndex,
     ]
 
+    def __init__(self, env):
+        super(KotlinDomain, self).__init__(env)
+        # targets which did not resolve since the last change of objects
+        self._missing = set()
+        # generated module indices since the last change of objects
+        self._index_cache = {}
+        self._external_urls = None
+        self._inventory = None
+
+    def external_urls(self):
+        # standard library table with the overrides from conf.py, built once
+        if self._external_urls is None:
+            urls = stdlib_urls(self.env.config.kotlin_stdlib_url)
+            urls.update(self.env.config.kotlin_external_types)
+            self._external_urls = dict((k, v) for k, v in urls.items() if v)
+        return self._external_urls
+
+    def inventory(self):
+        # objects of the projects listed in kotlin_inventories, read once
+        if self._inventory is None:
+            self._inventory = KotlinInventory(type_order)
+            for key, (base_url, filename) in sorted(self.env.config.kotlin_inventories.items()):
+                path = os.path.join(self.env.srcdir, filename)
+                try:
+                    self._inventory.add(read_inventory(path, base_url))
+                except Exception as exc:
+                    logger.warning(__('failed to read Kotlin inventory %r from %s: %s'),
+                                   key, path, exc)
+        return self._inventory
+
+    def index_cache(self):
+        return self._index_cache
+
+    def _index_item(self, fullname, docname, objtype, anchor):
+        entry = KotlinModuleIndex.make_entry(fullname, docname, objtype, anchor)
+        letter = KotlinModuleIndex.sigsorter(entry).upper()
+        return letter, (KotlinModuleIndex.indexsorter(entry), entry)
+
+    def note_object(self, fullname, objtype, anchor, docname=None):
+        if docname is None:
+            docname = self.env.docname
+        existing = self.data['objects'].get(fullname)
+        if existing is not None and existing[0] != docname:
+            # the first document by name keeps the object, whatever the
+            # order the documents are read or merged in
+            duplicates = self.data['duplicates'].setdefault(fullname, {})
+            if existing[0] < docname:
+                duplicates[docname] = (objtype, anchor)
+                return
+            duplicates[existing[0]] = existing[1:]
+        if existing is not None:
+            self._forget_object(fullname)
+        self.data['objects'][fullname] = (docname, objtype, anchor)
+        self.data['docs'].setdefault(docname, set()).add(fullname)
+        letter, item = self._index_item(fullname, docname, objtype, anchor)
+        bisect.insort(self.data['index'].setdefault(letter, []), item)
+        self._index_cache.clear()
+        if objtype in type_order:
+            name = fullname[len(objtype) + 1:]
+            self.data['names'].setdefault(name, []).append((objtype, docname, anchor))
+        self._missing.clear()
+
+    def _forget_object(self, fullname):
+        docname, objtype, anchor = self.data['objects'].pop(fullname)
+        self.data['docs'].get(docname, set()).discard(fullname)
+        letter, item = self._index_item(fullname, docname, objtype, anchor)
+        bucket = self.data['index'].get(letter, [])
+        position = bisect.bisect_left(bucket, item)
+        if position < len(bucket) and bucket[position] == item:
+            del bucket[position]
+            if not bucket:
+                del self.data['index'][letter]
+        self._index_cache.clear()
+        if objtype not in type_order:
+            return
+        name = fullname[len(objtype) + 1:]
+        entries = [e for e in self.data['names'].get(name, []) if e[:2] != (objtype, docname)]
+        if entries:
+            self.data['names'][name] = entries
+        else:
+            self.data['names'].pop(name, None)
+
+    def merge_domaindata(self, docnames, otherdata):
+        docnames = set(docnames)
+        for docname in sorted(docnames):
+            for fullname in sorted(otherdata['docs'].get(docname, ())):
+                fn, objtype, anchor = otherdata['objects'][fullname]
+                self.note_object(fullname, objtype, anchor, fn)
+        for fullname, duplicates in sorted(otherdata['duplicates'].items()):
+            for docname in sorted(docnames.intersection(duplicates)):
+                objtype, anchor = duplicates[docname]
+                self.note_object(fullname, objtype, anchor, docname)
+
     def clear_doc(self, docname):
-        for fullname, (fn, _, _) in list(self.data['objects'].items()):
-            if fn == docname:
-                del self.data['objects'][fullname]
+        for fullname, duplicates in list(self.data['duplicates'].items()):
+            duplicates.pop(docname, None)
+            if not duplicates:
+                del self.data['duplicates'][fullname]
+        for fullname in self.data['docs'].pop(docname, ()):
+            self._forget_object(fullname)
+            # the next document describing the object takes it over
+            duplicates = self.data['duplicates'].pop(fullname, None)
+            if duplicates:
+                for other in sorted(duplicates):
+                    self.note_object(fullname, duplicates[other][0], duplicates[other][1], other)
+        self._missing.clear()
+
+    def check_consistency(self):
+        # warned here once all documents are read, so serial and parallel
+        # builds report the same duplicates
+        for fullname, duplicates in sorted(self.data['duplicates'].items()):
+            other = self.data['objects'][fullname][0]
+            for docname in sorted(duplicates):
+                logger.warning(__('duplicate object description of %s, other instance in %s'),
+                               fullname, self.env.doc2path(other), location=docname)
 
     def resolve_xref(self, env, fromdocname, builder,
                      typ, target, node, contnode):
@@ -627,19 +757,35 @@ class KotlinDomain(Domain):
         else:
             test_target = target
 
+        # List<String> links to List
+        external_target = test_target.split('<', 1)[0].strip()
+
         point_pos = test_target.find('.')
         if point_pos != -1:
             test_target = test_target[point_pos:]
 
-        for refname, (docname, type, signature) in _iteritems(self.data['objects']):
-            for to in type_order:
-                if refname == to + ' ' + test_target:
-                    node = make_refnode(builder, fromdocname, docname, signature, contnode, test_target)
-                    return node
-        if test_target in kotlin_reserved:
+        if test_target not in self._missing:
+            entries = self.data['names'].get(test_target)
+            if entries:
+                objtype, docname, signature = entries[0]
+                node = make_refnode(builder, fromdocname, docname, signature, contnode, test_target)
+                return node
+            self._missing.add(test_target)
+
+        entry = self.inventory().get(test_target)
+        if entry:
+            objtype, url, dispname = entry
             node = nodes.reference(test_target, test_target)
-            node['refuri'] = formExternalUrl(test_target)
-            node['reftitle'] = test_target
+            node['refuri'] = url
+            node['reftitle'] = dispname
+
+            return node
+
+        url = self.external_urls().get(external_target)
+        if url:
+            node = nodes.reference(test_target, test_target)
+            node['refuri'] = url
+            node['reftitle'] = external_target
 
             return node
 
@@ -647,12 +793,30 @@ class KotlinDomain(Domain):
 
     def get_objects(self):
         for refname, (docname, type, signature) in _iteritems(self.data['objects']):
-            yield (refname, refname, type, docname, refname, 1)
-
-def make_index(app,*args):
-    from .autodoc import build_index
-    build_index(app)
+            # the anchor is the id of the target, which contains spaces for classes
+            dispname = refname
+            if type in type_order:
+                dispname = refname[len(type) + 1:]
+            yield (refname, dispname, type, docname, signature.replace(' ', '%20'), 1)
 
 def setup(app):
     app.add_domain(KotlinDomain)
-    # app.add_config_value('kotlin_search_path', ['../src'], 'env')
+    # directories of the sources documented by kotlin:autofile and kotlin:autoclass
+    app.add_config_value('kotlin_search_path', ['../src'], 'env')
+    app.add_config_value('kotlin_stdlib_url', 'https://kotlinlang.org/api/latest/jvm/stdlib/', 'env')
+    # name -> url, extends or overrides the standard library table, None disables a link
+    app.add_config_value('kotlin_external_types', {}, 'env')
+    # name -> (base url, objects.inv path relative to the source directory)
+    app.add_config_value('kotlin_inventories', {}, 'env')
+    # index name -> docname prefix, adds a module index of the package
+    app.add_config_value('kotlin_package_indices', {}, 'env')
+    app.connect('config-inited', add_package_indices)
+    app.connect('env-before-read-docs', prune_sources)
+    app.connect('env-merge-info', merge_sources)
+
+    return {
+        'version': __version__,
+        'env_version': KotlinDomain.data_version,
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  Pages the generated documentation is split into
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import collections
+import os
+import re
+
+layouts = ['file', 'package', 'class', 'adaptive']
+
+# output is relative to the documentation path, sources are source files
+# and label is printed when the page is written
+KotlinPage = collections.namedtuple('KotlinPage', ['output', 'sources', 'text', 'label'])
+
+
+def heading(title, underline='='):
+    return title + '\n' + underline * len(title) + '\n'
+
+
+def toctree(entries):
+    lines = ['.. toctree::', '   :maxdepth: 1', '']
+    lines.extend('   ' + entry for entry in entries)
+    return '\n'.join(lines) + '\n'
+
+
+def page_name(item):
+    # overloaded functions share a page, named without the parameters
+    name = item[0].split('(')[0].strip()
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', name) or '_'
+
+
+class KotlinLayout(object):
+    """
+    Assigns the rendered top level declarations of the sources to pages.
+
+    file      one page per source, the default
+    package   one page per source directory
+    class     one page per top level declaration, the page of the source
+              lists them
+    adaptive  sources smaller than min_size are gathered in the page of
+              their directory, the ones larger than max_size are split per
+              declaration, all others get a page of their own
+
+    Sources are added one by one as (name, type, text) of their
+    declarations. Pages gathering a directory are returned once all the
+    expected sources of the directory were added.
+    """
+
+    def __init__(self, name, source_path, min_size=4096, max_size=262144):
+        self.name = name
+        self.source_path = source_path
+        self.min_size = min_size
+        self.max_size = max_size
+        self.expect([])
+
+    @property
+    def aggregates(self):
+        """Whether the pages of a source depend on the other sources of its directory."""
+        return self.name in ('package', 'adaptive')
+
+    def expect(self, files):
+        self.remaining = collections.Counter(os.path.dirname(self.relpath(file)) for file in files)
+        # directory -> {file: declarations}
+        self.gathered = {}
+
+    def relpath(self, file):
+        return os.path.relpath(file, self.source_path)
+
+    def expected_outputs(self, file):
+        """Pages of the source which are known before it is rendered."""
+        rel = self.relpath(file)
+        if self.name in ('file', 'class'):
+            return [rel[:-3] + '.rst']
+        if self.name == 'package':
+            return [os.path.join(os.path.dirname(rel), 'package.rst')]
+        return []
+
+    def add(self, file, items):
+        rel = self.relpath(file)
+        directory = os.path.dirname(rel)
+        self.remaining[directory] -= 1
+
+        pages = []
+        # only the file layout writes pages without documented declarations
+        if items and (self.name == 'file' or any(item[2] for item in items)):
+            name = self.name
+            if name == 'adaptive':
+                size = sum(len(item[2]) for item in items)
+                if size > self.max_size:
+                    name = 'class'
+                elif size < self.min_size:
+                    name = 'package'
+                else:
+                    name = 'file'
+
+            if name == 'file':
+                pages.append(self.file_page(file, rel, items))
+            elif name == 'class':
+                pages.extend(self.class_pages(file, rel, items))
+            else:
+                self.gathered.setdefault(directory, {})[file] = items
+
+        if self.remaining[directory] <= 0 and directory in self.gathered:
+            pages.append(self.package_page(directory, self.gathered.pop(directory)))
+        return pages
+
+    def close(self):
+        """Pages of the directories whose sources did not all come."""
+        pages = [self.package_page(directory, self.gathered[directory])
+                 for directory in sorted(self.gathered)]
+        self.expect([])
+        return pages
+
+    def file_page(self, file, rel, items):
+        text = heading('Documentation for {}'.format(rel)) + '\n\n'
+        text += ''.join(item[2] for item in items)
+        return KotlinPage(rel[:-3] + '.rst', [file], text, rel)
+
+    def class_pages(self, file, rel, items):
+        base = rel[:-3]
+        groups = collections.OrderedDict()
+        for item in items:
+            if item[2]:
+                groups.setdefault(page_name(item), []).append(item)
+
+        pages = []
+        for name, group in groups.items():
+            text = heading(group[0][0].split('(')[0].strip()) + '\n'
+            text += ''.join(item[2] for item in group)
+            output = os.path.join(base, name + '.rst')
+            pages.append(KotlinPage(output, [file], text, output))
+
+        entries = [os.path.basename(base) + '/' + name for name in groups]
+        text = heading('Documentation for {}'.format(rel)) + '\n' + toctree(entries)
+        pages.insert(0, KotlinPage(base + '.rst', [file], text, rel))
+        return pages
+
+    def package_title(self, directory):
+        if directory:
+            return directory.replace(os.sep, '.')
+        return os.path.basename(os.path.abspath(self.source_path))
+
+    def package_page(self, directory, files):
+        text = heading('Documentation for package {}'.format(self.package_title(directory))) + '\n\n'
+        for file in sorted(files):
+            text += heading(os.path.basename(file), '-') + '\n'
+            text += ''.join(item[2] for item in files[file])
+        output = os.path.join(directory, 'package.rst')
+        return KotlinPage(output, sorted(files), text, output)
+
+    def index_pages(self, outputs):
+        """
+        Table of contents of every directory of the outputs, named
+        index.rst, which lists its pages and the contents of the
+        subdirectories. Directories listed by a page of the same name,
+        like the pages of the class layout, get none.
+        """
+        outputs = set(outputs)
+        pages = {}
+        subdirs = {}
+        for output in outputs:
+            directory = os.path.dirname(output)
+            pages.setdefault(directory, []).append(output)
+            while directory and directory + '.rst' not in outputs:
+                parent = os.path.dirname(directory)
+                subdirs.setdefault(parent, set()).add(directory)
+                pages.setdefault(parent, [])
+                directory = parent
+
+        result = []
+        for directory in sorted(pages):
+            if directory and directory + '.rst' in outputs:
+                continue
+            entries = sorted(os.path.basename(output)[:-4] for output in pages[directory])
+            entries += sorted(os.path.basename(sub) + '/index' for sub in subdirs.get(directory, ()))
+            title = 'Documentation for {}'.format(self.package_title(directory))
+            output = os.path.join(directory, 'index.rst')
+            result.append(KotlinPage(output, [], heading(title) + '\n' + toctree(entries), output))
+        return result
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  Single-pass structural scanner for Kotlin sources
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import bisect
+import re
+from array import array
+
+# significant tokens per lexer state, everything in between is skipped
+code_tokens = re.compile(r'"""|/\*|//|[{}()"\'\n]')
+string_tokens = re.compile(r'\\.|\$\{|["\n]')
+raw_string_tokens = re.compile(r'"""|\$\{|\n')
+char_tokens = re.compile(r"\\.|['\n]")
+block_comment_tokens = re.compile(r'/\*|\*/|\n')
+
+text_patterns = (code_tokens, string_tokens, raw_string_tokens, char_tokens, block_comment_tokens)
+# the same tokens in UTF-8 data, they are all ASCII so they never match
+# inside a multibyte character
+bytes_patterns = tuple(re.compile(pattern.pattern.encode('ascii')) for pattern in text_patterns)
+
+
+class KotlinSourceMap(object):
+    """
+    Structure of a Kotlin source built in one pass over the file.
+
+    Strings, string templates, characters and comments are skipped, so
+    only real code braces and parentheses are counted. For every line the
+    map stores the brace depth after the line and the parentheses balance
+    of the line. For every opened brace it stores the line of the matching
+    closing brace.
+
+    The source is scanned from data, the UTF-8 encoded file, when it is
+    given, so a memory mapped file is never decoded as a whole. Documentation
+    blocks are then found by looking at most lookback lines upwards instead
+    of indexing all lines.
+    """
+
+    def __init__(self, content, data=None, lookback=None):
+        self.content = content
+        self.depth = array('i', [0]) * len(content)
+        self.parens = array('i', [0]) * len(content)
+        # braces in the order they are opened: line, level and closing line
+        self.open_lines = array('i')
+        self.open_levels = array('i')
+        self.close_lines = array('i')
+        self.scan(data)
+        if data is not None:
+            self.docs = KotlinDocLookback(content, lookback)
+        else:
+            self.docs = KotlinDocIndex(content)
+
+    def scan(self, data=None):
+        if data is None:
+            text = ''.join(l if l.endswith('\n') else l + '\n' for l in self.content)
+            patterns = text_patterns
+            decode = None
+        else:
+            text = data
+            patterns = bytes_patterns
+            decode = bytes.decode
+
+        code, string, raw_string, char, block_comment = patterns
+        line = 0
+        depth = 0
+        parens = 0
+        comments = 0
+        templates = 0
+        pos = 0
+        pattern = code
+        # states to return to, (pattern, template depth or None)
+        states = []
+        braces = []
+
+        while True:
+            match = pattern.search(text, pos)
+            if not match:
+                break
+            token = match.group()
+            if decode is not None:
+                token = decode(token, 'latin-1')
+            pos = match.end()
+
+            if token == '\n':
+                if line < len(self.depth):
+                    self.depth[line] = depth
+                    self.parens[line] = parens
+                parens = 0
+                line += 1
+                # plain strings and chars can not span lines
+                if pattern is string or pattern is char:
+                    pattern = states.pop()[0]
+                continue
+
+            if pattern is code:
+                if token == '{':
+                    depth += 1
+                    if not templates:
+                        braces.append(len(self.open_lines))
+                        self.open_lines.append(line)
+                        self.open_levels.append(depth)
+                        self.close_lines.append(-1)
+                elif token == '}':
+                    if states and states[-1][1] == depth:
+                        pattern = states.pop()[0]
+                        templates -= 1
+                        continue
+                    depth -= 1
+                    if not templates and braces:
+                        self.close_lines[braces.pop()] = line
+                elif token == '(':
+                    parens += 1
+                elif token == ')':
+                    parens -= 1
+                elif token == '//':
+                    pos = text.find(b'\n' if decode else '\n', pos)
+                    if pos == -1:
+                        break
+                elif token == '/*':
+                    states.append((pattern, None))
+                    pattern = block_comment
+                    comments = 1
+                else:
+                    states.append((pattern, None))
+                    if token == '"""':
+                        pattern = raw_string
+                    elif token == '"':
+                        pattern = string
+                    else:
+                        pattern = char
+
+            elif pattern is block_comment:
+                # Kotlin block comments nest
+                if token == '/*':
+                    comments += 1
+                else:
+                    comments -= 1
+                    if comments == 0:
+                        pattern = states.pop()[0]
+
+            elif token == '${':
+                states.append((pattern, depth))
+                pattern = code
+                templates += 1
+
+            elif token[0] != '\\':
+                # closing quote of a string, raw string or char
+                pattern = states.pop()[0]
+
+        for index in range(line, len(self.depth)):
+            self.depth[index] = depth
+            self.parens[index] = parens
+            parens = 0
+        for record in braces:
+            self.close_lines[record] = len(self.content) - 1
+
+    def depth_before(self, index):
+        if index > 0:
+            return self.depth[index - 1]
+        return 0
+
+    def block_end(self, first, last, level):
+        """
+        Closing line of the last brace raising the depth to level on the
+        lines first..last, or None if there is no such brace.
+        """
+        end = None
+        start = bisect.bisect_left(self.open_lines, first)
+        stop = bisect.bisect_right(self.open_lines, last)
+        for record in range(start, stop):
+            if self.open_levels[record] == level:
+                end = self.close_lines[record]
+        return end
+
+    def logical_line(self, index, limit=6):
+        """
+        Join the line with the following ones until the parentheses are
+        balanced, but not more than limit lines.
+        """
+        l = self.content[index].rstrip()
+        balance = self.parens[index]
+        last = index
+        while balance != 0 and last - index < limit and last + 1 < len(self.content):
+            last += 1
+            balance += self.parens[last]
+            l += ' ' + self.content[last].strip()
+        return l, last
+
+
+class KotlinLines(object):
+    """
+    Lines of UTF-8 data, such as a memory mapped file, decoded when they
+    are read. Only the offsets of the lines are kept, plus a few recently
+    read lines. Lines end with '\\n' as in a file opened in text mode.
+    """
+
+    def __init__(self, data, cache_size=256):
+        self.data = data
+        self.offsets = array('q', [0])
+        pos = data.find(b'\n')
+        while pos != -1:
+            self.offsets.append(pos + 1)
+            pos = data.find(b'\n', pos + 1)
+        if self.offsets[-1] == len(data):
+            self.offsets.pop()
+        self.offsets.append(len(data))
+        self.cache = {}
+        self.cache_size = cache_size
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        line = self.cache.get(index)
+        if line is not None:
+            return line
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError(index)
+
+        line = self.data[self.offsets[index]:self.offsets[index + 1]].decode('utf-8')
+        if line.endswith('\r\n'):
+            line = line[:-2] + '\n'
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[index] = line
+        return line
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+def doc_line(line):
+    """
+    Split a line of a documentation block the same way get_doc_block does,
+    returns the text and the flags (ends block, starts doc, starts plain
+    comment, is a tag or annotation).
+    """
+    l = line.rstrip()
+    ends = False
+    starts = False
+    plain = False
+    if l.endswith("*/"):
+        ends = True
+        l = l[:-2]
+    if l.strip().startswith("/**"):
+        starts = True
+        l = l.strip()[3:]
+    elif l.startswith("/*"):
+        plain = True
+    return l, ends, starts, plain, l.strip().startswith('@')
+
+
+class KotlinDocIndex(object):
+    """
+    Documentation blocks of a file, precomputed in one pass so a block is
+    found in constant time instead of searching upwards from every
+    declaration. Returns the same blocks as get_doc_block.
+    """
+
+    def __init__(self, content):
+        self.content = content
+        # nearest line at or above which is not a skipped annotation
+        self.anchor = [-1] * len(content)
+        # nearest line at or above which opens a comment
+        self.opener = [-1] * len(content)
+        self.ends = bytearray(len(content))
+        self.plain = bytearray(len(content))
+
+        anchor = -1
+        opener = -1
+        for index, line in enumerate(content):
+            l, ends, starts, plain, tag = doc_line(line)
+            if plain or (starts and not tag):
+                opener = index
+            if ends or plain or not tag:
+                anchor = index
+            self.anchor[index] = anchor
+            self.opener[index] = opener
+            self.ends[index] = ends
+            self.plain[index] = plain
+
+    def doc_block(self, line):
+        """Documentation block ending on the line or above its annotations."""
+        if line < 0 or line >= len(self.content):
+            return []
+
+        end = self.anchor[line]
+        if end < 0 or not self.ends[end]:
+            return []
+
+        start = self.opener[end]
+        if start >= 0 and self.plain[start]:
+            return [] # not a doc comment
+
+        doc_block = []
+        for index in range(max(start, 0), end + 1):
+            l, ends, starts, plain, tag = doc_line(self.content[index])
+            if tag or (starts and l == ""):
+                continue
+            doc_block.append(l)
+        return doc_block
+
+
+class KotlinDocLookback(object):
+    """
+    Documentation blocks found by looking upwards from the declaration
+    like get_doc_block does, but not further than limit lines, so no
+    index of the whole file is needed.
+    """
+
+    def __init__(self, content, limit=None):
+        self.content = content
+        self.limit = limit or 1000
+
+    def doc_block(self, line):
+        if line >= len(self.content):
+            return []
+
+        doc_block = []
+        block_detected = False
+        for index in range(line, max(line - self.limit, -1), -1):
+            l, ends, starts, plain, tag = doc_line(self.content[index])
+            if ends:
+                block_detected = True
+            if plain:
+                return [] # not a doc comment
+            if tag:
+                continue
+            if not block_detected:
+                break
+            if not (starts and l == ""):
+                doc_block.insert(0, l)
+            if starts:
+                break
+        return doc_block
+
+
+def scan(content, data=None, lookback=None):
+    return KotlinSourceMap(content, data, lookback)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  Source to output manifest for incremental documentation builds
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import hashlib
+import io
+import json
+import os
+
+from . import __version__
+
+
+class KotlinManifest(object):
+    """
+    Records for every source file its content hash and the documents
+    generated from it, together with the generator options. Sources are
+    relative to the source path, outputs to the documentation path.
+
+    If the manifest was written by another package version or with other
+    options no source is current, so everything is generated again.
+    """
+
+    def __init__(self, path, options):
+        self.path = path
+        self.options = options
+        self.sources = {}
+        # tables of contents, which belong to no source
+        self.indexes = []
+        self.valid = False
+
+        try:
+            with io.open(path, mode='r', encoding='utf-8') as fp:
+                data = json.load(fp)
+        except (IOError, OSError, ValueError):
+            return
+
+        self.sources = data.get('sources', {})
+        self.indexes = data.get('indexes', [])
+        self.valid = data.get('version') == __version__ and data.get('options') == options
+
+    @staticmethod
+    def digest(file):
+        with io.open(file, mode='rb') as fp:
+            return hashlib.sha1(fp.read()).hexdigest()
+
+    def is_current(self, source, digest, doc_path):
+        entry = self.sources.get(source)
+        if not self.valid or not entry or entry['hash'] != digest:
+            return False
+        for output in entry['outputs']:
+            if not os.path.exists(os.path.join(doc_path, output)):
+                return False
+        return True
+
+    def source_outputs(self):
+        result = set()
+        for entry in self.sources.values():
+            result.update(entry['outputs'])
+        return result
+
+    def outputs(self):
+        return self.source_outputs() | set(self.indexes)
+
+    def update(self, source, digest, outputs):
+        self.sources[source] = {'hash': digest, 'outputs': sorted(outputs)}
+
+    def remove(self, source):
+        return self.sources.pop(source)['outputs']
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path))
+        except OSError:
+            pass
+
+        data = {
+            'version': __version__,
+            'options': self.options,
+            'sources': self.sources,
+            'indexes': self.indexes,
+        }
+        tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        with io.open(tmp_path, mode='w', encoding='utf-8') as fp:
+            json.dump(data, fp, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  Time and memory profile of a generator run
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import collections
+import contextlib
+import io
+import json
+import time
+import tracemalloc
+
+from . import __version__
+
+
+class KotlinProfile(object):
+    """
+    Wall time and traced memory of the generator phases and of every
+    source file.
+
+    Memory is traced with tracemalloc from the creation of the profile,
+    which slows the run down, so the times are only comparable between
+    profiled runs.
+    """
+
+    def __init__(self, top=10):
+        self.top = top
+        self.start = time.perf_counter()
+        # phase -> [seconds, net allocated bytes, peak bytes]
+        self.phases = collections.OrderedDict()
+        # file -> {phase: seconds}
+        self.files = {}
+        self.file_peaks = {}
+        self.symbols = collections.Counter()
+        tracemalloc.start()
+
+    @contextlib.contextmanager
+    def phase(self, name, file=None):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            self.add(name, seconds, current - before, peak - before, file)
+
+    def add(self, name, seconds, allocated=0, peak=0, file=None):
+        if name not in self.phases:
+            self.phases[name] = [0.0, 0, 0]
+        phase = self.phases[name]
+        phase[0] += seconds
+        phase[1] += allocated
+        phase[2] = max(phase[2], peak)
+
+        if file is not None:
+            times = self.files.setdefault(file, {})
+            times[name] = times.get(name, 0.0) + seconds
+
+    def add_timings(self, file, timings, peak=None):
+        # steps measured by KotlinFileIndex.parse_timed
+        for name, (seconds, allocated) in timings.items():
+            self.add(name, seconds, allocated, file=file)
+        if peak is not None:
+            self.file_peaks[file] = max(self.file_peaks.get(file, 0), peak)
+
+    def count(self, symbols):
+        for item in symbols:
+            self.symbols[item['type']] += 1
+            if 'members' in item:
+                for member in item['members'].index:
+                    self.symbols[member['type']] += 1
+            self.count(item['children'])
+
+    def report(self):
+        files = []
+        for file, times in self.files.items():
+            files.append({
+                'file': file,
+                'seconds': sum(times.values()),
+                'phases': times,
+                'peak_bytes': self.file_peaks.get(file),
+            })
+        files.sort(key=lambda entry: entry['seconds'], reverse=True)
+
+        return {
+            'version': __version__,
+            'seconds': time.perf_counter() - self.start,
+            'phases': collections.OrderedDict(
+                (name, {'seconds': seconds, 'net_bytes': allocated, 'peak_bytes': peak})
+                for name, (seconds, allocated, peak) in self.phases.items()),
+            'files': len(self.files),
+            'slowest_files': files[:self.top],
+            'symbols': dict(self.symbols),
+        }
+
+    def save(self, filename, report=None):
+        if report is None:
+            report = self.report()
+        with io.open(filename, mode='w', encoding='utf-8') as fp:
+            fp.write(json.dumps(report, indent=2))
+
+    @staticmethod
+    def summary(report):
+        yield 'Profile: {:.3f} s, {} files'.format(report['seconds'], report['files'])
+        for name, phase in report['phases'].items():
+            yield '  {:20} {:9.3f} s {:10.1f} KB net'.format(
+                name, phase['seconds'], phase['net_bytes'] / 1024.0)
+        if report['slowest_files']:
+            yield 'Slowest files:'
+            for entry in report['slowest_files']:
+                yield '  {:9.3f} s  {}'.format(entry['seconds'], entry['file'])
+        if report['symbols']:
+            yield 'Symbols:'
+            for name, count in sorted(report['symbols'].items()):
+                yield '  {:20} {:7}'.format(name, count)
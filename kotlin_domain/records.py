@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  Compact records of the indexed Kotlin symbols
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+from sys import intern
+
+_missing = object()
+
+
+class KotlinRecord(object):
+    """
+    Slotted record which can be used like the dict it replaces.
+
+    Fields which are not set are not in the record, the same way a key
+    is not in a dict. Strings of the interned fields are shared between
+    all records.
+    """
+
+    __slots__ = ()
+    interned = ()
+
+    def __init__(self, **fields):
+        for key, value in fields.items():
+            if key in self.interned and value is not None:
+                value = intern(value)
+            setattr(self, key, value)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        try:
+            setattr(self, key, value)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __delitem__(self, key):
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.__slots__ and hasattr(self, key)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, (KotlinRecord, dict)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, dict(self.items()))
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def pop(self, key, default=_missing):
+        value = self.get(key, _missing)
+        if value is _missing:
+            if default is _missing:
+                raise KeyError(key)
+            return default
+        delattr(self, key)
+        return value
+
+    def keys(self):
+        return [key for key in self.__slots__ if hasattr(self, key)]
+
+    def values(self):
+        return [getattr(self, key) for key in self.keys()]
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+
+class KotlinSymbol(KotlinRecord):
+    """Top level or nested declaration found by KotlinFileIndex."""
+
+    __slots__ = ('file', 'line', 'depth', 'type', 'scope', 'name', 'docstring',
+                 'param', 'children', 'raw', 'members')
+    interned = ('file', 'type', 'scope')
+
+
+class KotlinMember(KotlinRecord):
+    """Member of a declaration found by KotlinObjectIndex."""
+
+    __slots__ = ('scope', 'line', 'type', 'name', 'docstring', 'rest',
+                 'raw_value', 'raw')
+    interned = ('type', 'scope')
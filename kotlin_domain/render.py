@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  reStructured text of the indexed Kotlin declarations
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+from .indexer import KotlinFileIndex, KotlinObjectIndex
+
+
+def document(members, args, file, fp, indent):
+    for member in members:
+        add = True
+        if args.undoc is False and len(member['docstring']) == 0:
+            add = False
+        if args.private is False and member['scope'] != 'public':
+            add = False
+        if not add:
+            # print 'Skip documentation for ' + member['name']
+            continue
+
+        doc = KotlinFileIndex.documentation(
+            member,
+            indent=indent,
+            nodocstring=args.undoc,
+            noindex=args.noindex
+        )
+        for line in doc:
+            content = indent + line + "\n"
+            fp.write(content)
+
+        if args.members:
+            document_member(member, args, file, fp, indent)
+        fp.write('\n')
+
+
+def document_member(parent, args, file, fp, indent):
+    if 'members' not in parent:
+        return
+    for member in parent['members'].index:
+        add = True
+
+        # Always document enum cases
+        if args.undoc is False and len(member['docstring']) == 0 and member['type'] != 'enum_case':
+            add = False
+        if args.private is False and member['scope'] != 'public':
+            add = False
+        if not add:
+            continue
+
+        doc = KotlinObjectIndex.documentation(
+            member,
+            indent=indent,
+            nodocstring=False,
+            noindex=(args.noindex or args.noindex_members)
+        )
+        for line in doc:
+            content = indent + '   ' + line + "\n"
+            fp.write(content)
+
+    document(parent['children'], args, file, fp, indent + '   ')
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  Binary snapshot of the symbols of a source tree
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+# A snapshot starts with the magic, the schema version and the offset of the
+# header, followed by one zlib compressed JSON block per source file and the
+# JSON header at the end. The header lists the field names of the symbol and
+# member rows and the position of every file block, so a file is decoded only
+# when it is read and readers find the fields by name.
+
+import io
+import json
+import os
+import struct
+import zlib
+
+from . import __version__
+from .indexer import KotlinObjectIndex
+from .records import KotlinSymbol, KotlinMember
+
+magic = b'KTSNAP'
+schema_version = 1
+prefix = struct.Struct('<6sHQ')
+
+symbol_fields = ['line', 'depth', 'type', 'scope', 'name', 'docstring', 'param']
+member_fields = ['scope', 'line', 'type', 'name', 'docstring', 'rest', 'raw_value']
+
+
+def encode_symbol(item):
+    # fields, children, members or None
+    members = None
+    if 'members' in item:
+        members = [[member.get(key) for key in member_fields] for member in item['members'].index]
+    return [item.get(key) for key in symbol_fields] + [
+        [encode_symbol(child) for child in item['children']], members]
+
+
+def known_fields(record_type, fields, values):
+    # fields added by a later schema are skipped
+    return dict((key, value) for key, value in zip(fields, values) if key in record_type.__slots__)
+
+
+class KotlinSnapshotWriter(object):
+    """Writes the symbols of the sources, one file after the other."""
+
+    def __init__(self, path, source_path):
+        self.path = path
+        self.source_path = source_path
+        self.files = []
+        self.symbols = 0
+        self.tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)))
+        except OSError:
+            pass
+        self.fp = io.open(self.tmp_path, mode='wb')
+        self.fp.write(prefix.pack(magic, schema_version, 0))
+
+    def add(self, file, symbols):
+        rows = [encode_symbol(item) for item in symbols]
+        block = zlib.compress(json.dumps(rows, separators=(',', ':')).encode('utf-8'), 1)
+        stat = os.stat(file)
+        self.files.append([os.path.relpath(file, self.source_path).replace(os.sep, '/'),
+                           self.fp.tell(), len(block), stat.st_size, stat.st_mtime_ns])
+        self.fp.write(block)
+        self.symbols += len(symbols)
+
+    def close(self):
+        header = {
+            'version': __version__,
+            'schema': schema_version,
+            'source_path': self.source_path,
+            'symbol_fields': symbol_fields,
+            'member_fields': member_fields,
+            'files': self.files,
+        }
+        offset = self.fp.tell()
+        self.fp.write(json.dumps(header, sort_keys=True).encode('utf-8'))
+        self.fp.seek(0)
+        self.fp.write(prefix.pack(magic, schema_version, offset))
+        self.fp.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.fp.close()
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+
+class KotlinSnapshot(object):
+    """
+    Snapshot opened for reading. Only the header is read at first, the
+    symbols of a file are decoded when they are asked for.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with io.open(path, mode='rb') as fp:
+            head = fp.read(prefix.size)
+            if len(head) < prefix.size:
+                raise ValueError('{} is not a kotlinsphinx snapshot'.format(path))
+            name, schema, offset = prefix.unpack(head)
+            if name != magic:
+                raise ValueError('{} is not a kotlinsphinx snapshot'.format(path))
+            if schema > schema_version:
+                raise ValueError('{} has schema {}, this version reads up to {}'.format(
+                    path, schema, schema_version))
+            fp.seek(offset)
+            self.header = json.loads(fp.read().decode('utf-8'))
+
+        self.source_path = self.header['source_path']
+        self.symbol_fields = self.header['symbol_fields']
+        self.member_fields = self.header['member_fields']
+        self.entries = dict((entry[0], entry) for entry in self.header['files'])
+        self.files = [self.file_path(entry[0]) for entry in self.header['files']]
+
+    def file_path(self, rel):
+        return os.path.join(self.source_path, *rel.split('/'))
+
+    def rel(self, file):
+        return os.path.relpath(file, self.source_path).replace(os.sep, '/')
+
+    def symbols(self, file, fp=None):
+        """Decode the symbols of the file."""
+        rel, offset, length = self.entries[self.rel(file)][:3]
+        if fp is None:
+            with io.open(self.path, mode='rb') as fp:
+                return self.symbols(file, fp)
+        fp.seek(offset)
+        rows = json.loads(zlib.decompress(fp.read(length)).decode('utf-8'))
+        return [self.decode_symbol(row, file) for row in rows]
+
+    def decode_symbol(self, row, file):
+        count = len(self.symbol_fields)
+        item = KotlinSymbol(file=file, **known_fields(KotlinSymbol, self.symbol_fields, row[:count]))
+        item['children'] = [self.decode_symbol(child, file) for child in row[count]]
+        if row[count + 1] is not None:
+            item['members'] = KotlinObjectIndex.from_members(
+                KotlinMember(**known_fields(KotlinMember, self.member_fields, member))
+                for member in row[count + 1])
+        return item
+
+    def __iter__(self):
+        # (file, symbols) of all files in the order they were indexed
+        with io.open(self.path, mode='rb') as fp:
+            for file in self.files:
+                yield file, self.symbols(file, fp)
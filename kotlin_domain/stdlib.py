@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  Offline table of the Kotlin standard library types
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+stdlib_url = 'https://kotlinlang.org/api/latest/jvm/stdlib/'
+
+# package -> types documented on kotlinlang.org
+stdlib_types = {
+    'kotlin': (
+        'Annotation', 'Any', 'ArithmeticException', 'Array', 'AssertionError',
+        'Boolean', 'BooleanArray', 'Byte', 'ByteArray', 'Char', 'CharArray',
+        'CharSequence', 'ClassCastException', 'Comparable', 'Comparator',
+        'ConcurrentModificationException', 'Deprecated', 'DeprecationLevel',
+        'Double', 'DoubleArray', 'Enum', 'Error', 'Exception', 'Float',
+        'FloatArray', 'Function', 'IllegalArgumentException',
+        'IllegalStateException', 'IndexOutOfBoundsException', 'Int',
+        'IntArray', 'KotlinVersion', 'Lazy', 'LazyThreadSafetyMode', 'Long',
+        'LongArray', 'NoSuchElementException', 'NoWhenBranchMatchedException',
+        'Nothing', 'NullPointerException', 'Number', 'NumberFormatException',
+        'OptIn', 'Pair', 'PublishedApi', 'Result', 'RuntimeException', 'Short',
+        'ShortArray', 'String', 'Suppress', 'Throwable', 'Throws', 'Triple',
+        'UByte', 'UByteArray', 'UInt', 'UIntArray', 'ULong', 'ULongArray',
+        'UShort', 'UShortArray', 'UninitializedPropertyAccessException', 'Unit',
+        'UnsupportedOperationException',
+    ),
+    'kotlin.annotation': (
+        'AnnotationRetention', 'AnnotationTarget', 'MustBeDocumented',
+        'Repeatable', 'Retention', 'Target',
+    ),
+    'kotlin.collections': (
+        'AbstractCollection', 'AbstractList', 'AbstractMap', 'AbstractSet',
+        'ArrayDeque', 'ArrayList', 'Collection', 'Grouping', 'HashMap',
+        'HashSet', 'IndexedValue', 'Iterable', 'Iterator', 'LinkedHashMap',
+        'LinkedHashSet', 'List', 'ListIterator', 'Map', 'MutableCollection',
+        'MutableIterable', 'MutableIterator', 'MutableList',
+        'MutableListIterator', 'MutableMap', 'MutableSet', 'RandomAccess', 'Set',
+    ),
+    'kotlin.coroutines': (
+        'Continuation', 'CoroutineContext', 'EmptyCoroutineContext',
+    ),
+    'kotlin.jvm': (
+        'JvmField', 'JvmName', 'JvmOverloads', 'JvmStatic',
+        'JvmSuppressWildcards', 'Synchronized', 'Transient', 'Volatile',
+    ),
+    'kotlin.properties': (
+        'Delegates', 'ObservableProperty', 'ReadOnlyProperty',
+        'ReadWriteProperty',
+    ),
+    'kotlin.random': (
+        'Random',
+    ),
+    'kotlin.ranges': (
+        'CharProgression', 'CharRange', 'ClosedFloatingPointRange',
+        'ClosedRange', 'IntProgression', 'IntRange', 'LongProgression',
+        'LongRange', 'OpenEndRange', 'UIntProgression', 'UIntRange',
+        'ULongProgression', 'ULongRange',
+    ),
+    'kotlin.reflect': (
+        'KCallable', 'KClass', 'KFunction', 'KMutableProperty', 'KProperty',
+        'KType', 'KVisibility',
+    ),
+    'kotlin.sequences': (
+        'Sequence', 'SequenceScope',
+    ),
+    'kotlin.text': (
+        'Appendable', 'CharCategory', 'Charsets', 'MatchGroup', 'MatchResult',
+        'Regex', 'RegexOption', 'StringBuilder', 'Typography',
+    ),
+    'kotlin.time': (
+        'Duration', 'DurationUnit', 'TimeSource',
+    ),
+}
+
+
+def page_name(name):
+    # kotlinlang.org pages of UInt are named -u-int
+    out = []
+    for char in name:
+        if char.isupper():
+            out.append('-' + char.lower())
+        else:
+            out.append(char)
+    return ''.join(out)
+
+
+def stdlib_urls(base_url=stdlib_url):
+    """
+    Map of the standard library packages, types and fully qualified type
+    names to their documentation pages.
+    """
+    if not base_url.endswith('/'):
+        base_url += '/'
+
+    urls = {}
+    for package, types in stdlib_types.items():
+        urls[package] = base_url + package + '/index.html'
+        for name in types:
+            url = base_url + package + '/' + page_name(name) + '/index.html'
+            urls[name] = url
+            urls[package + '.' + name] = url
+    return urls
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  SQLite database of the symbols of a source tree
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import io
+import os
+import re
+import sqlite3
+from urllib.request import pathname2url
+
+from . import __version__
+
+# bump when the tables change, older databases are then created again
+schema_version = 1
+
+schema = [
+    '''CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT)''',
+    '''CREATE TABLE IF NOT EXISTS files (
+        id INTEGER PRIMARY KEY,
+        path TEXT UNIQUE NOT NULL,
+        package TEXT NOT NULL,
+        size INTEGER,
+        mtime_ns INTEGER)''',
+    '''CREATE TABLE IF NOT EXISTS symbols (
+        id INTEGER PRIMARY KEY,
+        file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+        parent_id INTEGER REFERENCES symbols(id) ON DELETE CASCADE,
+        name TEXT NOT NULL,
+        qualname TEXT NOT NULL,
+        fullname TEXT NOT NULL,
+        type TEXT NOT NULL,
+        scope TEXT,
+        line INTEGER,
+        signature TEXT,
+        docstring TEXT)''',
+    'CREATE INDEX IF NOT EXISTS symbols_name ON symbols(name)',
+    'CREATE INDEX IF NOT EXISTS symbols_qualname ON symbols(qualname)',
+    'CREATE INDEX IF NOT EXISTS symbols_fullname ON symbols(fullname)',
+    'CREATE INDEX IF NOT EXISTS symbols_file ON symbols(file_id)',
+    'CREATE INDEX IF NOT EXISTS symbols_parent ON symbols(parent_id)',
+    'CREATE INDEX IF NOT EXISTS symbols_type ON symbols(type, scope)',
+    'CREATE INDEX IF NOT EXISTS files_package ON files(package)',
+    '''CREATE TABLE IF NOT EXISTS parameters (
+        symbol_id INTEGER NOT NULL REFERENCES symbols(id) ON DELETE CASCADE,
+        position INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        type TEXT,
+        default_value TEXT,
+        PRIMARY KEY (symbol_id, position))''',
+]
+fts_schema = 'CREATE VIRTUAL TABLE IF NOT EXISTS symbols_fts USING fts5(fullname, docstring)'
+tables = ['symbols_fts', 'parameters', 'symbols', 'files', 'meta']
+
+package_pattern = re.compile(r'^\s*package\s+([\w.]+)', re.MULTILINE)
+parameter_pattern = re.compile(
+    r'^\s*(?:(?:vararg|noinline|crossinline|val|var|private|public|internal|protected|override)\s+)*'
+    r'(?P<name>\w+)\s*:?\s*(?P<type>[^=]*?)\s*(?:=\s*(?P<default>.*))?$')
+
+
+def read_package(file):
+    # the package statement comes before any declaration
+    try:
+        with io.open(file, encoding='utf-8', errors='replace') as fp:
+            match = package_pattern.search(fp.read(65536))
+    except (IOError, OSError):
+        return ''
+    return match.group(1) if match else ''
+
+
+def split_parameters(signature):
+    """Parameters of the first parenthesized list, split on the top level commas."""
+    start = signature.find('(')
+    if start == -1:
+        return []
+    parameters = []
+    depth = 0
+    current = ''
+    for char in signature[start + 1:]:
+        if char in '(<[{':
+            depth += 1
+        elif char in ')>]}':
+            if depth == 0 and char == ')':
+                break
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parameters.append(current)
+            current = ''
+            continue
+        current += char
+    parameters.append(current)
+
+    result = []
+    for text in parameters:
+        match = parameter_pattern.match(text)
+        if text.strip() and match:
+            result.append((match.group('name'), match.group('type') or None, match.group('default')))
+    return result
+
+
+def split_name(item):
+    # top level functions carry their signature in the name
+    name = item['name'].strip()
+    position = name.find('(')
+    if position > 0:
+        return name[:position].strip(), name[position:].strip()
+    return name, None
+
+
+class KotlinSymbolStore(object):
+    """
+    SQLite database of the files, symbols and parameters of a source tree
+    with a full text index of the names and the documentation.
+
+    Files are replaced one by one, a file which did not change since it
+    was stored keeps its rows. A readonly store opens an existing database
+    for queries and never changes it.
+    """
+
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        if readonly:
+            self.connection = sqlite3.connect('file:{}?mode=ro'.format(pathname2url(os.path.abspath(path))),
+                                              uri=True)
+            self.check()
+        else:
+            self.connection = sqlite3.connect(path)
+            self.connection.execute('PRAGMA foreign_keys = ON')
+            self.connection.execute('PRAGMA synchronous = NORMAL')
+            self.create()
+        # path -> (id, size, mtime_ns)
+        self.files = dict((path, (file_id, size, mtime_ns)) for file_id, path, size, mtime_ns in
+                          self.connection.execute('SELECT id, path, size, mtime_ns FROM files'))
+        self.updated = 0
+
+    def create(self):
+        try:
+            version = self.connection.execute(
+                "SELECT value FROM meta WHERE key = 'schema'").fetchone()
+        except sqlite3.OperationalError:
+            version = None
+        if version is not None and version[0] != str(schema_version):
+            for table in tables:
+                self.connection.execute('DROP TABLE IF EXISTS ' + table)
+
+        for statement in schema:
+            self.connection.execute(statement)
+        try:
+            self.connection.execute(fts_schema)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5, searches fall back to LIKE
+            self.fts = False
+        self.connection.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                                    [('schema', str(schema_version)), ('version', __version__)])
+        self.connection.commit()
+
+    def check(self):
+        """Raises ValueError unless the database has the tables of this version."""
+        try:
+            version = self.connection.execute(
+                "SELECT value FROM meta WHERE key = 'schema'").fetchone()
+        except sqlite3.DatabaseError:
+            version = None
+        if version is None or version[0] != str(schema_version):
+            self.connection.close()
+            raise ValueError('{} is not a symbol database of this version, index the sources '
+                             'with --database again'.format(self.path))
+        self.fts = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'symbols_fts'").fetchone() is not None
+
+    def is_current(self, file):
+        entry = self.files.get(file)
+        if entry is None:
+            return False
+        try:
+            stat = os.stat(file)
+        except OSError:
+            return False
+        return entry[1:] == (stat.st_size, stat.st_mtime_ns)
+
+    def remove(self, file):
+        entry = self.files.pop(file, None)
+        if entry is None:
+            return
+        if self.fts:
+            self.connection.execute(
+                'DELETE FROM symbols_fts WHERE rowid IN (SELECT id FROM symbols WHERE file_id = ?)',
+                (entry[0],))
+        self.connection.execute('DELETE FROM files WHERE id = ?', (entry[0],))
+
+    def update(self, file, symbols):
+        """Replace the rows of the file with its symbols."""
+        self.remove(file)
+        stat = os.stat(file)
+        package = read_package(file)
+        cursor = self.connection.execute(
+            'INSERT INTO files (path, package, size, mtime_ns) VALUES (?, ?, ?, ?)',
+            (file, package, stat.st_size, stat.st_mtime_ns))
+        self.files[file] = (cursor.lastrowid, stat.st_size, stat.st_mtime_ns)
+
+        # the ids are given here so the rows of a file are inserted at once
+        rows = []
+        parameters = []
+        start = self.connection.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM symbols').fetchone()[0]
+        self.add_symbols(rows, parameters, start, cursor.lastrowid, package, None, '', symbols)
+        self.connection.executemany(
+            'INSERT INTO symbols (id, file_id, parent_id, name, qualname, fullname, type, scope, line, signature, docstring) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        if self.fts:
+            self.connection.executemany('INSERT INTO symbols_fts (rowid, fullname, docstring) VALUES (?, ?, ?)',
+                                        [(row[0], row[5], row[10]) for row in rows])
+        self.connection.executemany(
+            'INSERT INTO parameters (symbol_id, position, name, type, default_value) VALUES (?, ?, ?, ?, ?)',
+            parameters)
+        self.updated += 1
+
+    def retain(self, files):
+        """Remove the files which are not in files."""
+        for file in sorted(set(self.files) - set(files)):
+            self.remove(file)
+
+    @staticmethod
+    def add_symbol(rows, parameters, start, file_id, package, parent_id, prefix, name, signature, typ, scope,
+                   line, docstring):
+        symbol_id = start + len(rows)
+        qualname = prefix + name
+        fullname = package + '.' + qualname if package else qualname
+        docstring = '\n'.join(text.strip().lstrip('*').strip() for text in docstring or [])
+        rows.append((symbol_id, file_id, parent_id, name, qualname, fullname, typ, scope, line, signature, docstring))
+        if signature:
+            parameters.extend((symbol_id, position) + parameter
+                              for position, parameter in enumerate(split_parameters(signature)))
+        return symbol_id, qualname
+
+    def add_symbols(self, rows, parameters, start, file_id, package, parent_id, prefix, symbols):
+        for item in symbols:
+            name, signature = split_name(item)
+            symbol_id, qualname = self.add_symbol(
+                rows, parameters, start, file_id, package, parent_id, prefix, name, signature,
+                item['type'], item['scope'], item['line'] + 1, item['docstring'])
+
+            for member in item['members'].index if 'members' in item else ():
+                rest = member.get('rest')
+                # lines of enum cases count from the class
+                line = item['line'] + 1 if member['type'] == 'enum_case' else member['line'] + 1
+                self.add_symbol(
+                    rows, parameters, start, file_id, package, symbol_id, qualname + '.', member['name'],
+                    rest if rest and rest.startswith('(') else None,
+                    member['type'], member['scope'], line, member['docstring'])
+
+            self.add_symbols(rows, parameters, start, file_id, package, symbol_id, qualname + '.',
+                             item['children'])
+
+    def query(self, name=None, search=None, type=None, scope=None, package=None, limit=50):
+        """
+        Symbols with the name, qualified name or full name, which may be a
+        glob, or matching the full text search, as dicts. A qualified name
+        also matches the end of the full name, like Inner.fun of the
+        nested class Outer.Inner.
+        """
+        conditions = []
+        params = []
+        join = ''
+        if name:
+            if any(char in name for char in '*?['):
+                conditions.append('(s.name GLOB ? OR s.qualname GLOB ? OR s.fullname GLOB ? OR s.fullname GLOB ?)')
+                params.extend([name] * 3 + ['*.' + name])
+            else:
+                # the name index finds the candidates of the qualified name
+                conditions.append('(s.name = ? OR s.qualname = ? OR s.fullname = ? OR '
+                                  '(s.name = ? AND substr(s.fullname, -?) = ?))')
+                params.extend([name] * 3 + [name.rsplit('.', 1)[-1], len(name) + 1, '.' + name])
+        if search:
+            if self.fts:
+                join = 'JOIN symbols_fts ON symbols_fts.rowid = s.id'
+                conditions.append('symbols_fts MATCH ?')
+                params.append(search)
+            else:
+                conditions.append('(s.fullname LIKE ? OR s.docstring LIKE ?)')
+                params.extend(['%' + search + '%'] * 2)
+        if type:
+            conditions.append('s.type = ?')
+            params.append(type)
+        if scope:
+            conditions.append('s.scope = ?')
+            params.append(scope)
+        if package:
+            conditions.append('(f.package = ? OR f.package LIKE ?)')
+            params.extend([package, package + '.%'])
+
+        sql = ('SELECT s.id, f.path, f.package, s.line, s.type, s.scope, s.name, s.qualname, s.fullname, '
+               's.signature, s.docstring FROM symbols s JOIN files f ON f.id = s.file_id ' + join)
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY s.fullname, s.id LIMIT ?'
+        params.append(limit)
+
+        columns = ['id', 'path', 'package', 'line', 'type', 'scope', 'name', 'qualname', 'fullname',
+                   'signature', 'docstring']
+        rows = [dict(zip(columns, row)) for row in self.connection.execute(sql, params)]
+        for row in rows:
+            row['parameters'] = [
+                {'name': name, 'type': typ, 'default': default}
+                for name, typ, default in self.connection.execute(
+                    'SELECT name, type, default_value FROM parameters WHERE symbol_id = ? ORDER BY position',
+                    (row['id'],))]
+        return rows
+
+    def stats(self):
+        return 'Symbol database: {} files updated, {} files stored'.format(self.updated, len(self.files))
+
+    def close(self):
+        if not self.readonly:
+            self.connection.commit()
+            # keeps the statistics of the query planner up to date
+            self.connection.execute('PRAGMA optimize')
+        self.connection.close()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  Concurrent and atomic writing of the generated documents
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import collections
+import concurrent.futures
+import os
+import threading
+import time
+
+
+def write_if_changed(filename, text):
+    """
+    Write the text unless the file already holds it, so Sphinx does not
+    read it again. The text goes to a temporary file which replaces the
+    old one, so a running Sphinx build never sees a half written file.
+    """
+    try:
+        with open(filename, "r") as fp:
+            if fp.read() == text:
+                return False
+    except (IOError, OSError):
+        pass
+
+    try:
+        os.makedirs(os.path.dirname(filename))
+    except OSError:
+        pass
+
+    tmp_path = '{}.{}.{}.tmp'.format(filename, os.getpid(), threading.get_ident())
+    try:
+        with open(tmp_path, "w") as fp:
+            fp.write(text)
+        os.replace(tmp_path, filename)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return True
+
+
+def timed_write(filename, text):
+    start = time.perf_counter()
+    changed = write_if_changed(filename, text)
+    return changed, time.perf_counter() - start
+
+
+class KotlinDocumentWriter(object):
+    """
+    Writes rendered documents by a small thread pool, which hides the
+    latency of network filesystems.
+
+    Written documents are returned in the order they were submitted, as
+    (key, filename, changed, seconds). At most two documents per thread
+    wait to be written, so the rendered text does not pile up in memory.
+    """
+
+    def __init__(self, jobs=4):
+        self.jobs = jobs
+        self.executor = None
+        if jobs > 1:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+        self.pending = collections.deque()
+
+    def submit(self, key, filename, text):
+        """Queue the document, returns the documents written meanwhile."""
+        if self.executor is None:
+            return [(key, filename) + timed_write(filename, text)]
+
+        self.pending.append((key, filename, self.executor.submit(timed_write, filename, text)))
+        done = []
+        while len(self.pending) > self.jobs * 2:
+            done.append(self.collect())
+        return done
+
+    def collect(self):
+        key, filename, future = self.pending.popleft()
+        return (key, filename) + future.result()
+
+    def close(self):
+        """Wait for the queued documents, returns them."""
+        done = []
+        try:
+            while self.pending:
+                done.append(self.collect())
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+        return done
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  Tests of the kotlin:autofile and kotlin:autoclass directives
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from sphinx.application import Sphinx
+
+source = '''package com.example
+
+/**
+ * A feature of the map.
+ */
+class Feature(val id: Long) {
+    /**
+     * Serializes the feature.
+     */
+    fun toJson(indent: Int = 2): String = ""
+
+    /**
+     * A point of the feature.
+     */
+    data class Point(val x: Double, val y: Double) {
+        /**
+         * Distance to the other point.
+         */
+        fun distance(other: Point): Double = 0.0
+    }
+}
+'''
+
+page = '''Auto
+====
+
+.. kotlin:autofile:: com/example/Feature.kt
+   :noindex:
+
+.. kotlin:autoclass:: Feature
+   :noindex:
+
+.. kotlin:autoclass:: Feature.Point
+   :noindex:
+'''
+
+
+class AutodocTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix='kotlinsphinx-test-')
+        os.makedirs(os.path.join(self.path, 'src', 'com', 'example'))
+        os.makedirs(os.path.join(self.path, 'docs'))
+        with io.open(os.path.join(self.path, 'src', 'com', 'example', 'Feature.kt'), 'w') as fp:
+            fp.write(source)
+        with io.open(os.path.join(self.path, 'docs', 'conf.py'), 'w') as fp:
+            fp.write("extensions = ['kotlin_domain']\n")
+        with io.open(os.path.join(self.path, 'docs', 'index.rst'), 'w') as fp:
+            fp.write(page)
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def build(self):
+        docs = os.path.join(self.path, 'docs')
+        build = os.path.join(self.path, 'build')
+        warnings = io.StringIO()
+        app = Sphinx(docs, docs, build, os.path.join(build, '.doctrees'), 'html',
+                     status=io.StringIO(), warning=warnings, freshenv=True)
+        app.build()
+        with io.open(os.path.join(build, 'index.html'), encoding='utf-8') as fp:
+            return fp.read(), warnings.getvalue()
+
+    def test_noindex(self):
+        html, warnings = self.build()
+        self.assertEqual(warnings, '')
+        self.assertIn('toJson', html)
+        self.assertIn('Serializes the feature.', html)
+        # nested declarations get the option as well
+        self.assertIn('A point of the feature.', html)
+        self.assertIn('Distance to the other point.', html)
+        # the option is not written into the page as text
+        self.assertNotIn(':noindex:', html)
+
+
+if __name__ == '__main__':
+    unittest.main()
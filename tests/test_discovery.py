@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  Tests of the discovery of the Kotlin sources
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from kotlin_domain.discovery import KotlinSourceFinder
+
+
+class DiscoveryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix='kotlinsphinx-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def write(self, rel, text='package x\n'):
+        filename = os.path.join(self.path, *rel.split('/'))
+        try:
+            os.makedirs(os.path.dirname(filename))
+        except OSError:
+            pass
+        with io.open(filename, 'w') as fp:
+            fp.write(text)
+
+    def find(self, **kwargs):
+        files = KotlinSourceFinder(**kwargs).find([self.path])
+        return sorted(os.path.relpath(file, self.path).replace(os.sep, '/') for file in files)
+
+    def test_build_outputs(self):
+        self.write('build/A.kt')
+        self.write('app/build.gradle.kts', '')
+        self.write('app/build/B.kt')
+        self.write('app/src/com/example/build/C.kt')
+        self.assertEqual(self.find(), ['app/src/com/example/build/C.kt'])
+        self.assertEqual(len(self.find(exclude=[], skip_build=False)), 3)
+
+    def test_gitignore_any_depth(self):
+        self.write('.gitignore', '**/gen/api\n')
+        self.write('gen/api/A.kt')
+        self.write('src/gen/api/B.kt')
+        self.write('src/gen/C.kt')
+        self.write('api/D.kt')
+        self.assertEqual(self.find(gitignore=True), ['api/D.kt', 'src/gen/C.kt'])
+
+    def test_gitignore_anchored(self):
+        self.write('.gitignore', 'gen/api\n')
+        self.write('gen/api/A.kt')
+        self.write('src/gen/api/B.kt')
+        self.assertEqual(self.find(gitignore=True), ['src/gen/api/B.kt'])
+
+
+if __name__ == '__main__':
+    unittest.main()
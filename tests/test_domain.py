@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  Tests of the Kotlin domain
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import io
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from sphinx.application import Sphinx
+
+
+class DomainTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix='kotlinsphinx-test-')
+        docs = os.path.join(self.path, 'docs')
+        os.makedirs(docs)
+        with io.open(os.path.join(docs, 'conf.py'), 'w') as fp:
+            fp.write("extensions = ['kotlin_domain']\n")
+        names = ['page{:02}'.format(i) for i in range(12)]
+        for i, name in enumerate(names):
+            with io.open(os.path.join(docs, name + '.rst'), 'w') as fp:
+                fp.write(u'{0}\n====\n\n'.format(name))
+                for k in range(3):
+                    fp.write(u'.. kotlin:class:: Shared{}\n\n'.format((i * 3 + k) % 7))
+        with io.open(os.path.join(docs, 'index.rst'), 'w') as fp:
+            fp.write(u'Index\n=====\n\n.. toctree::\n\n' + u''.join(u'   {}\n'.format(n) for n in names))
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def build(self, jobs):
+        docs = os.path.join(self.path, 'docs')
+        build = os.path.join(self.path, 'build{}'.format(jobs))
+        warnings = io.StringIO()
+        app = Sphinx(docs, docs, build, os.path.join(build, '.doctrees'), 'html',
+                     status=io.StringIO(), warning=warnings, freshenv=True, parallel=jobs)
+        app.build()
+        objects = dict((name, docname) for name, (docname, objtype, anchor)
+                       in app.env.domaindata['kotlin']['objects'].items())
+        return sorted(re.findall(r'duplicate object description.*', warnings.getvalue())), objects
+
+    def test_duplicates(self):
+        warnings, objects = self.build(1)
+        # 36 descriptions of 7 classes
+        self.assertEqual(len(warnings), 29)
+        # the first page describing a class keeps it
+        self.assertEqual(objects['class Shared3'], 'page01')
+        self.assertEqual(self.build(4), (warnings, objects))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  Tests of the documentation generator
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from kotlin_domain import generator
+
+
+def source(name):
+    return 'package com.example\n\n/**\n * Class {0}.\n */\nclass {0}\n'.format(name)
+
+
+class TocTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix='kotlinsphinx-test-')
+        self.source_path = os.path.join(self.path, 'src')
+        self.documentation_path = os.path.join(self.path, 'docs')
+        os.makedirs(os.path.join(self.source_path, 'p1'))
+        for name in ('index', 'Beta'):
+            with io.open(os.path.join(self.source_path, 'p1', name + '.kt'), 'w') as fp:
+                fp.write(source(name.title()))
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def run_generator(self, *options):
+        argv = [self.source_path, self.documentation_path, '--quiet', '--no-cache'] + list(options)
+        with contextlib.redirect_stdout(io.StringIO()):
+            generator.generate_main(argv)
+
+    def test_source_named_index(self):
+        # the table of contents would replace the page of index.kt
+        with self.assertRaises(generator.KotlinOverwriteError):
+            self.run_generator('--toc')
+        with io.open(os.path.join(self.documentation_path, 'p1', 'index.rst')) as fp:
+            self.assertIn('.. kotlin:class:: Index', fp.read())
+
+    def test_package_layout(self):
+        self.run_generator('--toc', '--layout', 'package')
+        with io.open(os.path.join(self.documentation_path, 'p1', 'index.rst')) as fp:
+            self.assertIn('   package', fp.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
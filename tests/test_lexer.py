@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  Tests of the single pass lexer of the Kotlin sources
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import random
+import unittest
+
+from kotlin_domain.indexer import get_doc_block
+from kotlin_domain.lexer import KotlinDocIndex, KotlinDocLookback, scan
+
+
+def lines(text):
+    return text.splitlines(True)
+
+
+class SourceMapTest(unittest.TestCase):
+
+    def assertDepth(self, text, depth, parens=None):
+        content = lines(text)
+        for source in (scan(content), scan(content, text.encode('utf-8'))):
+            self.assertEqual(list(source.depth), depth)
+            if parens is not None:
+                self.assertEqual(list(source.parens), parens)
+
+    def test_braces_in_strings(self):
+        self.assertDepth('val s = "{ ( not code"\n'
+                         'class A {\n'
+                         '    val r = """ } ) \n'
+                         ' { """\n'
+                         '}\n',
+                         [0, 1, 1, 1, 0], [0, 0, 0, 0, 0])
+
+    def test_escaped_quotes(self):
+        self.assertDepth('val s = "\\" {"\n'
+                         'fun f() {\n'
+                         '}\n',
+                         [0, 1, 0])
+
+    def test_templates(self):
+        self.assertDepth('class A {\n'
+                         '    val s = "${map["{"]} { ${ if (x) { "}" } else { 2 } } $name"\n'
+                         '    val r = """${ listOf(1).map { it } } {"""\n'
+                         '}\n',
+                         [1, 1, 1, 0])
+        # braces of templates are not blocks of the class
+        content = lines('class A {\n'
+                        '    val s = "${ listOf(1).map { it } }"\n'
+                        '}\n')
+        self.assertIsNone(scan(content).block_end(1, 1, 2))
+        self.assertEqual(scan(content).block_end(0, 0, 1), 2)
+
+    def test_char_literals(self):
+        self.assertDepth("val a = '{'\n"
+                         "val b = '\\''\n"
+                         "class A {\n"
+                         "    val c = '}'\n"
+                         "}\n",
+                         [0, 0, 1, 1, 0])
+
+    def test_nested_block_comments(self):
+        self.assertDepth('/* outer /* inner { */\n'
+                         '   still a comment } ( */\n'
+                         'class A { // }\n'
+                         '}\n',
+                         [0, 0, 1, 0], [0, 0, 0, 0])
+
+    def test_block_end(self):
+        content = lines('class A {\n'
+                        '    fun f() {\n'
+                        '        val s = "}"\n'
+                        '    }\n'
+                        '}\n')
+        source = scan(content)
+        self.assertEqual(source.block_end(0, 0, 1), 4)
+        self.assertEqual(source.block_end(1, 1, 2), 3)
+        self.assertIsNone(source.block_end(2, 2, 3))
+
+    def test_logical_line(self):
+        content = lines('fun f(a: Int,\n'
+                        '      b: String = ")"): Int\n')
+        self.assertEqual(scan(content).logical_line(0), ('fun f(a: Int, b: String = ")"): Int', 1))
+
+
+class DocBlockTest(unittest.TestCase):
+
+    # lines doc blocks are made of, including the ones get_doc_block treats
+    # in a special way
+    pieces = [
+        '/**\n', '/** One line. */\n', '/**  Starts with text\n', ' * Text of the block.\n',
+        ' *\n', ' * @param id the id\n', ' */\n', '   */\n', '/* plain comment */\n',
+        '/* plain\n', '@Deprecated("x")\n', '    @JvmStatic\n', '\n', 'class A\n',
+        '    fun f(): Int = 1\n', '// line comment\n', 'val x = 1 /* inline */\n',
+    ]
+
+    def assertBlocks(self, content):
+        index = KotlinDocIndex(content)
+        lookback = KotlinDocLookback(content, len(content) + 1)
+        self.assertEqual(index.doc_block(-1), [])
+        for line in range(len(content)):
+            expected = get_doc_block(content, line)
+            self.assertEqual(index.doc_block(line), expected, (content, line))
+            self.assertEqual(lookback.doc_block(line), expected, (content, line))
+
+    def test_examples(self):
+        self.assertBlocks(lines('/**\n'
+                                ' * A feature.\n'
+                                ' * @param id the id\n'
+                                ' */\n'
+                                '@Serializable\n'
+                                'data class Feature(val id: Long)\n'
+                                '/* not documentation */\n'
+                                'class Plain\n'
+                                '/** Short. */ class Short\n'))
+
+    def test_random_sources(self):
+        generator = random.Random(3)
+        for run in range(300):
+            content = [generator.choice(self.pieces) for line in range(generator.randint(1, 25))]
+            self.assertBlocks(content)
+
+    def test_lookback_limit(self):
+        content = ['/**\n'] + [' * Line.\n'] * 20 + [' */\n', 'class A\n']
+        # the opening line is out of reach, the block is cut there
+        self.assertEqual(KotlinDocLookback(content, 5).doc_block(21), [' * Line.'] * 4 + [' '])
+        self.assertEqual(KotlinDocLookback(content, 100).doc_block(21), get_doc_block(content, 21))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+################################################################################
+# Project:  Kotlin to sphinx
+# Purpose:  Tests of the symbol database
+# Author:   Dmitry Barishnikov, dmitry.baryshnikov@nextgis.ru
+################################################################################
+# Copyright (C) 2018-2019, NextGIS <info@nextgis.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import hashlib
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from kotlin_domain.indexer import KotlinFileIndex
+from kotlin_domain.store import KotlinSymbolStore
+
+source = '''package com.example
+
+/**
+ * The outer class.
+ */
+class Outer {
+    /**
+     * The inner class.
+     */
+    class Inner {
+        /**
+         * Calls it.
+         */
+        fun call(count: Int): Unit {}
+
+        /**
+         * Calls it again.
+         */
+        fun callAgain(): Unit {}
+    }
+}
+'''
+
+
+class StoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix='kotlinsphinx-test-')
+        self.file = os.path.join(self.path, 'Outer.kt')
+        with io.open(self.file, 'w') as fp:
+            fp.write(source)
+        self.database = os.path.join(self.path, 'symbols.db')
+        store = KotlinSymbolStore(self.database)
+        store.update(self.file, KotlinFileIndex.index_file(self.file))
+        store.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def digest(self, path):
+        with open(path, 'rb') as fp:
+            return hashlib.sha1(fp.read()).hexdigest()
+
+    def query(self, name):
+        store = KotlinSymbolStore(self.database, readonly=True)
+        try:
+            return [row['fullname'] for row in store.query(name)]
+        finally:
+            store.close()
+
+    def test_nested_names(self):
+        self.assertEqual(self.query('Inner.call'), ['com.example.Outer.Inner.call'])
+        self.assertEqual(self.query('Inner.call*'),
+                         ['com.example.Outer.Inner.call', 'com.example.Outer.Inner.callAgain'])
+        self.assertEqual(self.query('Outer.Inner.call'), ['com.example.Outer.Inner.call'])
+        self.assertEqual(self.query('nner.call'), [])
+
+    def test_readonly(self):
+        digest = self.digest(self.database)
+        self.query('call')
+        self.assertEqual(self.digest(self.database), digest)
+
+        other = os.path.join(self.path, 'other.db')
+        connection = sqlite3.connect(other)
+        connection.execute('CREATE TABLE data (value TEXT)')
+        connection.commit()
+        connection.close()
+        digest = self.digest(other)
+        with self.assertRaises(ValueError):
+            KotlinSymbolStore(other, readonly=True)
+        self.assertEqual(self.digest(other), digest)
+
+
+if __name__ == '__main__':
+    unittest.main()